@@ -0,0 +1,21 @@
+import importlib
+
+# names are imported on first use so that `python -m epidemic` starts fast
+_EXPORTS = {
+    'Infectable': 'infectable', 'SeasonalFluVirus': 'infectable', 'SARSCoV2': 'infectable',
+    'Cholera': 'infectable', 'InfectableType': 'infectable', 'get_infectable': 'infectable',
+    'PATHOGENS': 'infectable', 'register_pathogen': 'infectable', 'get_pathogen': 'infectable',
+    'Healthy': 'state', 'AsymptomaticSick': 'state', 'SymptomaticSick': 'state', 'Dead': 'state',
+    'DepartmentOfHealth': 'state', 'Policy': 'state', 'Lockdown': 'state', 'set_grid': 'state',
+    'Person': 'person', 'DefaultPerson': 'person', 'CommunityPerson': 'person', 'create_persons': 'person',
+    'Simulation': 'simulation', 'StopReason': 'simulation', 'count_states': 'simulation',
+    'Scenario': 'scenario',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+    return getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+from .scenario import Scenario
+
+
+def plot(results, path):
+    # matplotlib is only needed for plots, keep it out of batch runs
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    figure, axes = plt.subplots()
+    for run in results['runs']:
+        for name in run['history'][0]:
+            axes.plot([counts[name] for counts in run['history']], label='{} (seed {})'.format(name, run['seed']))
+            if 'lower' in run:
+                axes.fill_between(range(len(run['history'])), [counts[name] for counts in run['lower']],
+                                  [counts[name] for counts in run['upper']], alpha=0.2)
+    axes.set_xlabel('day')
+    axes.legend()
+    figure.savefig(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m epidemic', description='Run a virus spread scenario.')
+    parser.add_argument('scenario', help='scenario JSON file')
+    parser.add_argument('-o', '--output', help='results JSON file, overrides the scenario output')
+    parser.add_argument('--plot', help='save the state curves to this image file')
+    args = parser.parse_args(argv)
+
+    try:
+        scenario = Scenario.load(args.scenario)
+    except (OSError, ValueError, TypeError) as e:
+        parser.error(str(e))
+    results = scenario.run()
+
+    output = args.output or scenario.output
+    if output is None:
+        json.dump(results, sys.stdout)
+        sys.stdout.write('\n')
+    else:
+        with open(output, 'w') as f:
+            json.dump(results, f)
+    if args.plot:
+        plot(results, args.plot)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,163 @@
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from . import state
+from .scenario import Scenario
+from .simulation import Simulation
+
+# fixed-seed scenarios stressing one part of the daily step each
+REFERENCE_SCENARIOS = {
+    # an ordinary outbreak: moving around, a few contacts, recoveries
+    'outbreak': {'population': 2000, 'grid': [0, 60, 0, 60], 'days': 20, 'seed': 1,
+                 'pathogens': [{'type': 'SARSCoV2', 'infected': 20}]},
+    # almost everyone ill for the whole run, so SymptomaticSick.day_actions dominates
+    'symptomatic': {'population': 2000, 'grid': [0, 100, 0, 100], 'days': 15, 'seed': 2,
+                    'pathogens': [{'type': 'SeasonalFlu', 'infected': 2000, 'strength': 100.0}]},
+    # a crowded grid with two pathogens, so contact handling dominates
+    'contacts': {'population': 3000, 'grid': [0, 15, 0, 15], 'days': 15, 'seed': 3,
+                 'pathogens': [{'type': 'Cholera', 'infected': 10}, {'type': 'SeasonalFlu', 'infected': 10}]},
+}
+REPEATS = 5
+# allowed relative loss of throughput and growth of allocations before a run counts as a regression
+THROUGHPUT_TOLERANCE = 0.35
+ALLOCATION_TOLERANCE = 0.25
+# allocations this small are noise, whatever their relative change
+ALLOCATION_SLACK = 16 * 1024
+CALIBRATION_OPS = 200000
+
+
+def calibrate():
+    # operations per second of a fixed pure Python workload, so throughputs compare across machines
+    rng = random.Random(0)
+    start = time.perf_counter()
+    buckets = defaultdict(list)
+    for k in range(CALIBRATION_OPS):
+        buckets[(rng.randint(0, 99), k % 97)].append(k)
+    return CALIBRATION_OPS / (time.perf_counter() - start)
+
+
+def build(config):
+    # the simulation a scenario runs, without early stops so every run steps through all the days
+    scenario = Scenario.from_dict(config)
+    state.set_grid(*scenario.grid)
+    random.seed(scenario.seeds[0])
+    persons = scenario.create_population()
+    return Simulation(persons, days=scenario.days, early_stop=False, households=scenario.households,
+                      contact_radius=scenario.contact_radius, contact_decay=scenario.contact_decay)
+
+
+def time_run(config, repeats=REPEATS):
+    # the best of a few runs from fresh populations, each next to a calibration run so that both
+    # see the same load on a shared machine
+    throughput = calibration = 0
+    for _ in range(repeats):
+        simulation = build(config)
+        gc.collect()
+        calibration = max(calibration, calibrate())
+        start = time.perf_counter()
+        simulation.run()
+        elapsed = time.perf_counter() - start
+        throughput = max(throughput, len(simulation.persons) * simulation.days / elapsed)
+    return throughput, calibration
+
+
+def trace_run(config):
+    # per day, the peak of memory allocated above the start of the day and the memory kept after it
+    simulation = build(config)
+    gc.collect()
+    peaks, retained = [], []
+    tracemalloc.start()
+    try:
+        for _ in range(simulation.days):
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            simulation.step()
+            current, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - before)
+            retained.append(current - before)
+    finally:
+        tracemalloc.stop()
+    return sum(peaks) / len(peaks), sum(retained) / len(retained)
+
+
+def measure(config, repeats=REPEATS):
+    grid = state.set_grid(0, 0, 0, 0)
+    try:
+        throughput, calibration = time_run(config, repeats)
+        peak, retained = trace_run(config)
+    finally:
+        state.set_grid(*grid)
+    return {
+        'agent_days_per_second': throughput,
+        'calibration': calibration,
+        'relative_throughput': throughput / calibration,
+        'peak_bytes_per_day': peak,
+        'retained_bytes_per_day': retained,
+    }
+
+
+def measure_all(scenarios=REFERENCE_SCENARIOS, repeats=REPEATS):
+    return {'scenarios': {name: measure(config, repeats) for name, config in scenarios.items()}}
+
+
+def compare(measured, baselines, throughput_tolerance=THROUGHPUT_TOLERANCE,
+            allocation_tolerance=ALLOCATION_TOLERANCE):
+    # messages for every scenario slower or more memory-hungry than its baseline allows
+    regressions = []
+    for name, baseline in baselines['scenarios'].items():
+        if name not in measured['scenarios']:
+            regressions.append('{}: not measured'.format(name))
+            continue
+        metrics = measured['scenarios'][name]
+        lowest = baseline['relative_throughput'] * (1 - throughput_tolerance)
+        if metrics['relative_throughput'] < lowest:
+            regressions.append('{}: {:.0f} agent-days/s is {:.0%} below the baseline'.format(
+                name, metrics['agent_days_per_second'],
+                1 - metrics['relative_throughput'] / baseline['relative_throughput']))
+        for metric in ('peak_bytes_per_day', 'retained_bytes_per_day'):
+            highest = max(baseline[metric], 0) * (1 + allocation_tolerance) + ALLOCATION_SLACK
+            if metrics[metric] > highest:
+                regressions.append('{}: {} {:.0f} exceeds {:.0f}'.format(name, metric, metrics[metric], highest))
+    return regressions
+
+
+def load_baselines(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baselines(path, measured):
+    with open(path, 'w') as f:
+        json.dump(measured, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m epidemic.benchmark',
+                                     description='Compare the reference scenarios against stored baselines.')
+    parser.add_argument('baselines', help='baselines JSON file')
+    parser.add_argument('--update', action='store_true', help='store the new measurements as the baselines')
+    parser.add_argument('--repeats', type=int, default=REPEATS)
+    args = parser.parse_args(argv)
+
+    measured = measure_all(repeats=args.repeats)
+    for name, metrics in measured['scenarios'].items():
+        print('{:12} {:10.0f} agent-days/s {:10.0f} peak B/day {:10.0f} retained B/day'.format(
+            name, metrics['agent_days_per_second'], metrics['peak_bytes_per_day'],
+            metrics['retained_bytes_per_day']))
+    if args.update:
+        save_baselines(args.baselines, measured)
+        return 0
+    regressions = compare(measured, load_baselines(args.baselines))
+    for regression in regressions:
+        print(regression, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import csv
+from array import array
+from itertools import islice
+from math import isfinite
+from .compact import CompactPopulation, MAX_COORDINATE
+from .infectable import InfectableType
+
+CHUNK_SIZE = 100000
+COLUMNS = ('age', 'weight', 'home_j', 'home_i')
+# prior immunity columns are named immune_<InfectableType name> unless mapped otherwise
+IMMUNITY_PREFIX = 'immune_'
+TRUE = frozenset(('1', 'true', 't', 'yes', 'y'))
+FALSE = frozenset(('0', 'false', 'f', 'no', 'n', ''))
+# largest finite float32, larger weights turn into inf in the 'f' column
+FLOAT32_MAX = 3.4028234663852886e38
+LIMITS = {
+    'age': ('B', 1, 255),
+    'weight': ('f', 1e-3, FLOAT32_MAX),
+    'home_j': ('H', 0, MAX_COORDINATE),
+    'home_i': ('H', 0, MAX_COORDINATE),
+}
+
+
+class PopulationReader:
+    # fills a CompactPopulation chunk by chunk, so only one chunk of text rows is in memory
+    def __init__(self, names, columns=None, immunity=None):
+        columns = dict(zip(COLUMNS, COLUMNS), **(columns or {}))
+        if immunity is None:
+            immunity = {t.name: IMMUNITY_PREFIX + t.name for t in InfectableType
+                        if IMMUNITY_PREFIX + t.name in names}
+        self.names = list(names)
+        self.population = CompactPopulation()
+        self.lines = 0
+        # file line of every row of the current chunk, when the caller knows them
+        self.line_numbers = None
+
+        missing = [name for name in list(columns.values()) + list(immunity.values()) if name not in self.names]
+        if missing:
+            raise ValueError('Missing columns: {}'.format(', '.join(missing)))
+        self.positions = {column: self.names.index(name) for column, name in columns.items()}
+        self.immunity = []
+        for type_name, name in immunity.items():
+            if type_name not in InfectableType.__members__:
+                raise ValueError('Unknown pathogen type {}'.format(type_name))
+            self.immunity.append((InfectableType[type_name], self.names.index(name)))
+
+    def error(self, offset, column, value, reason):
+        if self.line_numbers is not None:
+            return ValueError('Line {}: {} {!r} {}'.format(self.line_numbers[offset], column, value, reason))
+        # rows are counted from 1 without the header
+        return ValueError('Row {}: {} {!r} {}'.format(self.lines + offset + 1, column, value, reason))
+
+    def convert(self, column, values):
+        typecode, low, high = LIMITS[column]
+        convert = float if typecode == 'f' else int
+        try:
+            converted = array(typecode, map(convert, values))
+            # nan slips through min and max, and inf through an open upper limit
+            if converted and all(map(isfinite, converted)) and low <= min(converted) and max(converted) <= high:
+                return converted
+        except (ValueError, OverflowError):
+            pass
+        # find the culprit only once the bulk conversion failed
+        for offset, value in enumerate(values):
+            try:
+                number = convert(value)
+            except ValueError:
+                raise self.error(offset, column, value, 'is not a valid {}'.format(convert.__name__))
+            if not isfinite(number):
+                raise self.error(offset, column, value, 'is not finite')
+            if not low <= number <= high:
+                raise self.error(offset, column, value, 'is out of [{}, {}]'.format(low, high))
+        raise ValueError('Could not convert {}'.format(column))
+
+    def flags(self, infectable_type, values):
+        bit = 1 << (infectable_type.value - 1)
+        table = dict.fromkeys(FALSE, 0)
+        table.update(dict.fromkeys(TRUE, bit))
+        try:
+            return bytes(map(table.__getitem__, values))
+        except KeyError:
+            pass
+        flags = bytearray(len(values))
+        for offset, value in enumerate(values):
+            value = value.strip().lower()
+            if value not in table:
+                raise self.error(offset, IMMUNITY_PREFIX + infectable_type.name, value, 'is not a yes/no value')
+            flags[offset] = table[value]
+        return bytes(flags)
+
+    def add_rows(self, rows, line_numbers=None):
+        if not rows:
+            return
+        self.line_numbers = line_numbers
+        if set(map(len, rows)) != {len(self.names)}:
+            for offset, row in enumerate(rows):
+                if len(row) != len(self.names):
+                    raise self.error(offset, 'row', row, 'has {} fields, expected {}'.format(len(row), len(self.names)))
+        fields = list(zip(*rows))
+        columns = {column: self.convert(column, fields[position]) for column, position in self.positions.items()}
+        antibodies = None
+        for infectable_type, position in self.immunity:
+            flags = self.flags(infectable_type, fields[position])
+            if antibodies is None:
+                antibodies = flags
+            else:
+                # one bit per type, so OR-ing the whole chunk at once is safe
+                antibodies = (int.from_bytes(antibodies, 'little') | int.from_bytes(flags, 'little')).to_bytes(
+                    len(flags), 'little')
+        self.population.extend(columns['age'], columns['weight'], columns['home_j'], columns['home_i'], antibodies)
+        self.lines += len(rows)
+
+
+def read_csv(path, columns=None, immunity=None, chunk_size=CHUNK_SIZE, delimiter=','):
+    # columns maps age/weight/home_j/home_i to header names, immunity maps InfectableType names to header names
+    with open(path, newline='') as f:
+        rows = csv.reader(f, delimiter=delimiter)
+        reader = PopulationReader(next(rows), columns, immunity)
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            reader.add_rows(chunk)
+    return reader.population
+
+
+def read_fixed_width(path, fields, columns=None, immunity=None, chunk_size=CHUNK_SIZE, header=False):
+    # fields maps a column name to its [start, end) character range
+    slices = [slice(start, end) for start, end in fields.values()]
+    reader = PopulationReader(list(fields), columns, immunity)
+    with open(path) as f:
+        # errors name the line of the file, counting the header and blank lines
+        line_number = 0
+        if header:
+            next(f, None)
+            line_number = 1
+        while True:
+            lines = list(islice(f, chunk_size))
+            if not lines:
+                break
+            numbered = [(line_number + offset + 1, line) for offset, line in enumerate(lines) if line.strip()]
+            line_number += len(lines)
+            reader.add_rows([[line[field].strip() for field in slices] for _, line in numbered],
+                            [number for number, _ in numbered])
+    return reader.population
@@ -0,0 +1,196 @@
+from array import array
+from random import randint
+from . import state
+from .compact import CompactPopulation, CompactSimulation, ASYMPTOMATIC, SYMPTOMATIC, DEAD
+from .infectable import InfectableType, get_pathogen
+from .person import Person
+from .state import AsymptomaticSick
+
+# infection stage of one pathogen
+NONE, INFECTED, ILL, IMMUNE = range(4)
+
+
+class PathogenColumns:
+    # the infection by one InfectableType of every agent, independent of the other pathogens
+    def __init__(self, infectable_type, n_persons):
+        self.infectable_type = infectable_type
+        self.virus_class = get_pathogen(infectable_type)
+        self.stage = array('B', bytes(n_persons))
+        self.days = array('B', bytes(n_persons))
+        self.strength = array('f', bytes(4 * n_persons))
+        self.contag = array('f', bytes(4 * n_persons))
+        # indices in the INFECTED and ILL stages, so passes only visit the sick
+        self.infected = set()
+        self.ill = set()
+
+    def infect(self, index, strength, contag, days=0):
+        if self.stage[index] != NONE:
+            return False
+        self.stage[index] = INFECTED
+        self.days[index] = days
+        self.strength[index] = strength
+        self.contag[index] = contag
+        self.infected.add(index)
+        return True
+
+    def fall_ill(self, index):
+        self.stage[index] = ILL
+        self.infected.discard(index)
+        self.ill.add(index)
+
+    def remove(self, index):
+        self.infected.discard(index)
+        self.ill.discard(index)
+
+    def is_carrier(self, index):
+        return index in self.infected or index in self.ill
+
+    def counts(self):
+        return {
+            'AsymptomaticSick': len(self.infected),
+            'SymptomaticSick': len(self.ill),
+            'Immune': self.stage.count(IMMUNE),
+        }
+
+
+class CoinfectionSimulation(CompactSimulation):
+    # every pathogen runs the single virus rules on its own columns, people may carry several at once;
+    # someone ill with any of them stays in bed, the symptoms of all of them add up
+    def __init__(self, population, pathogens=tuple(InfectableType), **kwargs):
+        super().__init__(population, **kwargs)
+        n_persons = len(population)
+        self.pathogens = [PathogenColumns(infectable_type, n_persons) for infectable_type in pathogens]
+        self.dead = bytearray(n_persons)
+        self.n_dead = 0
+        self.pathogen_history = []
+
+        for columns in self.pathogens:
+            bit = 1 << (columns.infectable_type.value - 1)
+            for index, antibodies in enumerate(population.antibodies):
+                if antibodies & bit:
+                    columns.stage[index] = IMMUNE
+            value = columns.infectable_type.value
+            for index, pathogen in enumerate(population.pathogen):
+                if pathogen == value and population.state[index] in (ASYMPTOMATIC, SYMPTOMATIC):
+                    columns.stage[index] = NONE
+                    columns.infect(index, population.strength[index], population.contag[index],
+                                   population.days_sick[index])
+                    if population.state[index] == SYMPTOMATIC:
+                        columns.fall_ill(index)
+        for index in range(n_persons):
+            if population.state[index] == DEAD:
+                self.die(index)
+
+    def columns(self, infectable_type):
+        for columns in self.pathogens:
+            if columns.infectable_type == infectable_type:
+                return columns
+        raise ValueError('{} is not simulated'.format(infectable_type))
+
+    def get_infected(self, index, virus):
+        if self.dead[index]:
+            return False
+        return self.columns(virus.get_type()).infect(index, virus.strength, virus.contag)
+
+    def bedridden(self):
+        ill = set()
+        for columns in self.pathogens:
+            ill |= columns.ill
+        return ill
+
+    def day_phase(self):
+        population = self.population
+        CompactPopulation.check_grid(state.min_j, state.max_j, state.min_i, state.max_i)
+        min_j, max_j, min_i, max_i = state.min_j, state.max_j, state.min_i, state.max_i
+        ill, dead, j, i = self.bedridden(), self.dead, population.j, population.i
+        for index in range(len(population)):
+            if not dead[index] and index not in ill:
+                j[index] = randint(min_j, max_j)
+                i[index] = randint(min_i, max_i)
+
+        # one symptom pass per pathogen, then everyone in bed is checked once
+        for columns in self.pathogens:
+            columns.virus_class.cause_symptoms_columns(population.temperature, population.water, columns.ill)
+        temperature, water, weight = population.temperature, population.water, population.weight
+        for index in sorted(ill):
+            if temperature[index] >= Person.MAX_TEMPERATURE_TO_SURVIVE or \
+                    water[index] / weight[index] <= Person.LOWEST_WATER_PCT_TO_SURVIVE:
+                self.die(index)
+
+    def die(self, index):
+        self.dead[index] = 1
+        self.n_dead += 1
+        self.population.state[index] = DEAD
+        for columns in self.pathogens:
+            columns.remove(index)
+            # only the living count as immune
+            columns.stage[index] = NONE
+
+    def contact_phase(self):
+        infected = []
+        dead = self.dead
+        for group in self.colocated_groups():
+            for columns in self.pathogens:
+                if not columns.infected and not columns.ill:
+                    continue
+                # the first carrier in the group infects everyone without this pathogen so far
+                carrier = next((index for index in group if columns.is_carrier(index)), None)
+                if carrier is None:
+                    continue
+                strength, contag, stage = columns.strength[carrier], columns.contag[carrier], columns.stage
+                for index in group:
+                    if stage[index] == NONE and not dead[index]:
+                        columns.infect(index, strength, contag)
+                        infected.append((index, columns.infectable_type))
+        if self.incidence is not None:
+            j, i = self.population.j, self.population.i
+            self.incidence.record((j[index], i[index]) for index, _ in infected)
+        return infected
+
+    def night_phase(self):
+        population = self.population
+        ill, dead = self.bedridden(), self.dead
+        for index in range(len(population)):
+            if not dead[index] and index not in ill:
+                population.j[index] = population.home_j[index]
+                population.i[index] = population.home_i[index]
+
+        for columns in self.pathogens:
+            stage, days = columns.stage, columns.days
+            for index in columns.virus_class.fight_virus_columns(columns.strength, population.age, columns.ill):
+                stage[index] = IMMUNE
+                columns.ill.discard(index)
+            for index in list(columns.infected):
+                if days[index] == AsymptomaticSick.DAYS_SICK_TO_FEEL_BAD:
+                    columns.fall_ill(index)
+                else:
+                    days[index] += 1
+
+    def counts(self):
+        ill = self.bedridden()
+        infected = set()
+        for columns in self.pathogens:
+            infected |= columns.infected
+        infected -= ill
+        n_persons = len(self.population)
+        return {
+            'Healthy': n_persons - self.n_dead - len(ill) - len(infected),
+            'AsymptomaticSick': len(infected),
+            'SymptomaticSick': len(ill),
+            'Dead': self.n_dead,
+        }
+
+    def counts_by_type(self):
+        return {columns.infectable_type.name: columns.counts() for columns in self.pathogens}
+
+    def step(self):
+        super().step()
+        self.pathogen_history.append(self.counts_by_type())
+
+    def run(self):
+        super().run()
+        # early stops repeat the last counts, as for history
+        missing = len(self.history) - len(self.pathogen_history)
+        if missing and self.pathogen_history:
+            self.pathogen_history.extend(dict(self.pathogen_history[-1]) for _ in range(missing))
+        return self.history
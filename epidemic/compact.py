@@ -0,0 +1,274 @@
+from array import array
+from copy import deepcopy
+from random import randint
+from . import state
+from .infectable import InfectableType, get_pathogen
+from .person import Person, DefaultPerson
+from .simulation import Simulation, STATE_NAMES
+from .state import Healthy, AsymptomaticSick, SymptomaticSick, Dead
+
+HEALTHY, ASYMPTOMATIC, SYMPTOMATIC, DEAD = range(4)
+STATE_CLASSES = (Healthy, AsymptomaticSick, SymptomaticSick, Dead)
+MAX_COORDINATE = 2 ** 16 - 1
+
+
+class CompactPopulation:
+    # one narrow typed column per attribute instead of a Person object per agent
+    def __init__(self, n_persons=0):
+        self.age = array('B', bytes(n_persons))
+        self.weight = array('f', bytes(4 * n_persons))
+        self.temperature = array('f', [36.6]) * n_persons
+        self.water = array('f', bytes(4 * n_persons))
+        self.home_j = array('H', bytes(2 * n_persons))
+        self.home_i = array('H', bytes(2 * n_persons))
+        self.j = array('H', bytes(2 * n_persons))
+        self.i = array('H', bytes(2 * n_persons))
+        self.state = array('B', bytes(n_persons))
+        self.days_sick = array('B', bytes(n_persons))
+        # InfectableType value of the virus, 0 for none
+        self.pathogen = array('B', bytes(n_persons))
+        self.strength = array('f', bytes(4 * n_persons))
+        self.contag = array('f', bytes(4 * n_persons))
+        # bit (value - 1) is set for every infectable type the agent has antibodies to
+        self.antibodies = array('B', bytes(n_persons))
+
+    def __len__(self):
+        return len(self.age)
+
+    def extend(self, age, weight, home_j, home_i, antibodies=None):
+        # appends healthy people at home, all columns must be of the same length
+        n_persons = len(age)
+        self.age.extend(age)
+        self.weight.extend(weight)
+        self.temperature.extend(array('f', [36.6]) * n_persons)
+        self.water.extend(0.6 * value for value in weight)
+        self.home_j.extend(home_j)
+        self.home_i.extend(home_i)
+        self.j.extend(home_j)
+        self.i.extend(home_i)
+        zeros = bytes(n_persons)
+        self.state.frombytes(zeros)
+        self.days_sick.frombytes(zeros)
+        self.pathogen.frombytes(zeros)
+        self.strength.frombytes(bytes(4 * n_persons))
+        self.contag.frombytes(bytes(4 * n_persons))
+        self.antibodies.extend(antibodies if antibodies is not None else zeros)
+
+    def copy(self):
+        population = CompactPopulation()
+        for name, column in vars(self).items():
+            setattr(population, name, array(column.typecode, column))
+        return population
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in vars(self).values())
+
+    @staticmethod
+    def check_grid(min_j, max_j, min_i, max_i):
+        if min(min_j, min_i) < 0 or max(max_j, max_i) > MAX_COORDINATE:
+            raise ValueError('Compact coordinates must be within [0, {}]'.format(MAX_COORDINATE))
+
+    @classmethod
+    def create(cls, min_j, max_j, min_i, max_i, n_persons):
+        # the same draws as create_persons, without building the people
+        cls.check_grid(min_j, max_j, min_i, max_i)
+        population = cls(n_persons)
+        for index in range(n_persons):
+            population.home_j[index] = population.j[index] = randint(min_j, max_j)
+            population.home_i[index] = population.i[index] = randint(min_i, max_i)
+            population.age[index] = randint(1, 90)
+            weight = randint(30, 120)
+            population.weight[index] = weight
+            population.water[index] = 0.6 * weight
+        return population
+
+    @classmethod
+    def from_persons(cls, persons):
+        population = cls(len(persons))
+        for index, person in enumerate(persons):
+            population.set_person(index, person)
+        return population
+
+    def set_person(self, index, person):
+        for position in (person.home_position, person.position):
+            if not all(0 <= value <= MAX_COORDINATE for value in position):
+                raise ValueError('Compact coordinates must be within [0, {}]'.format(MAX_COORDINATE))
+        self.age[index] = person.age
+        self.weight[index] = person.weight
+        self.temperature[index] = person.temperature
+        self.water[index] = person.water
+        self.home_j[index], self.home_i[index] = person.home_position
+        self.j[index], self.i[index] = person.position
+        for code, state_class in enumerate(STATE_CLASSES):
+            if isinstance(person.state, state_class):
+                self.state[index] = code
+        self.days_sick[index] = getattr(person.state, 'days_sick', 0)
+        if person.virus is not None:
+            self.pathogen[index] = person.virus.get_type().value
+            self.strength[index] = person.virus.strength
+            self.contag[index] = person.virus.contag
+        else:
+            self.pathogen[index] = 0
+        self.antibodies[index] = sum(1 << (t.value - 1) for t in person.antibody_types)
+
+    def person(self, index):
+        person = DefaultPerson(home_position=(self.home_j[index], self.home_i[index]),
+                               age=self.age[index], weight=self.weight[index])
+        person.position = (self.j[index], self.i[index])
+        person.temperature = self.temperature[index]
+        person.water = self.water[index]
+        if self.pathogen[index]:
+            virus_class = get_pathogen(InfectableType(self.pathogen[index]))
+            person.virus = virus_class(strength=self.strength[index], contag=self.contag[index])
+        person.antibody_types = {t for t in InfectableType if self.antibodies[index] >> (t.value - 1) & 1}
+        person.set_state(STATE_CLASSES[self.state[index]](person))
+        if self.state[index] == ASYMPTOMATIC:
+            person.state.days_sick = self.days_sick[index]
+        return person
+
+    def to_persons(self):
+        return [self.person(index) for index in range(len(self))]
+
+    def get_infected(self, index, virus):
+        # Healthy.get_infected on the columns
+        if self.state[index] != HEALTHY or self.antibodies[index] >> (virus.get_type().value - 1) & 1:
+            return False
+        self.pathogen[index] = virus.get_type().value
+        self.strength[index] = virus.strength
+        self.contag[index] = virus.contag
+        self.state[index] = ASYMPTOMATIC
+        self.days_sick[index] = 0
+        return True
+
+    def counts(self):
+        counts = dict.fromkeys(STATE_NAMES, 0)
+        for code, name in enumerate(STATE_NAMES):
+            counts[name] = self.state.count(code)
+        return counts
+
+
+class CompactSimulation(Simulation):
+    # the agent dynamics of Simulation on a CompactPopulation, physiology rounded to float32 every day
+    def __init__(self, population, days=100, early_stop=True, fill_remaining=True,
+                 steady_days=Simulation.STEADY_STATE_DAYS, tolerance=Simulation.STEADY_STATE_TOLERANCE, seed=None,
+                 incidence=None):
+        super().__init__([], days=days, early_stop=early_stop, fill_remaining=fill_remaining,
+                         steady_days=steady_days, tolerance=tolerance, seed=seed, incidence=incidence)
+        self.population = population
+
+    @staticmethod
+    def by_pathogen(population, indices):
+        # indices grouped by the virus class they carry, for one kernel call per pathogen
+        groups = {}
+        pathogen = population.pathogen
+        for index in indices:
+            groups.setdefault(pathogen[index], []).append(index)
+        return [(get_pathogen(InfectableType(value)), group) for value, group in sorted(groups.items())]
+
+    def day_phase(self):
+        population = self.population
+        CompactPopulation.check_grid(state.min_j, state.max_j, state.min_i, state.max_i)
+        states, j, i = population.state, population.j, population.i
+        temperature, water, weight = population.temperature, population.water, population.weight
+        min_j, max_j, min_i, max_i = state.min_j, state.max_j, state.min_i, state.max_i
+        ill = []
+        for index in range(len(population)):
+            code = states[index]
+            if code == HEALTHY or code == ASYMPTOMATIC:
+                j[index] = randint(min_j, max_j)
+                i[index] = randint(min_i, max_i)
+            elif code == SYMPTOMATIC:
+                ill.append(index)
+
+        for virus_class, indices in self.by_pathogen(population, ill):
+            virus_class.cause_symptoms_columns(temperature, water, indices)
+        # hospitalization has no listeners here, only death matters
+        for index in ill:
+            if temperature[index] >= Person.MAX_TEMPERATURE_TO_SURVIVE or \
+                    water[index] / weight[index] <= Person.LOWEST_WATER_PCT_TO_SURVIVE:
+                states[index] = DEAD
+
+    def colocated_groups(self):
+        by_position = {}
+        j, i = self.population.j, self.population.i
+        for index in range(len(self.population)):
+            by_position.setdefault(j[index] << 16 | i[index], []).append(index)
+        return [group for group in by_position.values() if len(group) > 1]
+
+    def contact_phase(self):
+        population = self.population
+        states, pathogen, antibodies = population.state, population.pathogen, population.antibodies
+        infected = []
+        for group in self.colocated_groups():
+            # the first sick person carrying a pathogen someone has no antibodies for infects them
+            carriers = {}
+            for index in group:
+                if states[index] == ASYMPTOMATIC or states[index] == SYMPTOMATIC:
+                    carriers.setdefault(pathogen[index], index)
+            if not carriers:
+                continue
+            contacts = []
+            for index in group:
+                if states[index] != HEALTHY:
+                    continue
+                for infectable_type, carrier in carriers.items():
+                    if not antibodies[index] >> (infectable_type - 1) & 1:
+                        contacts.append((carrier, index))
+                        break
+            for carrier, index in contacts:
+                pathogen[index] = pathogen[carrier]
+                population.strength[index] = population.strength[carrier]
+                population.contag[index] = population.contag[carrier]
+                states[index] = ASYMPTOMATIC
+                population.days_sick[index] = 0
+                infected.append(index)
+        if self.incidence is not None:
+            self.incidence.record((population.j[index], population.i[index]) for index in infected)
+        return infected
+
+    def night_phase(self):
+        population = self.population
+        states, days_sick = population.state, population.days_sick
+        ill = []
+        for index in range(len(population)):
+            code = states[index]
+            if code == HEALTHY or code == ASYMPTOMATIC:
+                population.j[index] = population.home_j[index]
+                population.i[index] = population.home_i[index]
+                if code == ASYMPTOMATIC:
+                    if days_sick[index] == AsymptomaticSick.DAYS_SICK_TO_FEEL_BAD:
+                        states[index] = SYMPTOMATIC
+                    else:
+                        days_sick[index] += 1
+            elif code == SYMPTOMATIC:
+                ill.append(index)
+
+        for virus_class, indices in self.by_pathogen(population, ill):
+            for index in virus_class.fight_virus_columns(population.strength, population.age, indices):
+                states[index] = HEALTHY
+                population.antibodies[index] |= 1 << (population.pathogen[index] - 1)
+                population.pathogen[index] = 0
+
+    def counts(self):
+        return self.population.counts()
+
+
+def precision_error(persons, days, seed=0):
+    # largest share of the population on which the compact and the full precision curves disagree
+    population = CompactPopulation.from_persons(persons)
+    full = Simulation(deepcopy(persons), days=days, seed=seed).run()
+    compact = CompactSimulation(population, days=days, seed=seed).run()
+    error = 0
+    for full_counts, compact_counts in zip(full, compact):
+        for name in STATE_NAMES:
+            error = max(error, abs(full_counts[name] - compact_counts[name]))
+    return error / max(1, len(persons))
+
+
+def check_precision(persons, days, tolerance=0.01, seed=0):
+    error = precision_error(persons, days, seed)
+    if error > tolerance:
+        raise ValueError('Compact storage is off by {:.2%} of the population, over the {:.2%} tolerance'.format(
+            error, tolerance))
+    return error
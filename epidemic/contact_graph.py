@@ -0,0 +1,129 @@
+import struct
+import zlib
+from array import array
+from .state import Healthy, AsymptomaticSick
+from .simulation import Simulation, SICK_STATES
+from .timeline import TimelineSchedule
+
+MAGIC = b'CSRG'
+HEADER = struct.Struct('<4sI')
+DAY_HEADER = struct.Struct('<IIII')
+
+
+class ContactGraph:
+    # contacts of one day in compressed sparse row form
+    def __init__(self, day, indptr, indices):
+        self.day = day
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_groups(cls, day, n_nodes, groups):
+        neighbors = {}
+        for group in groups:
+            for node in group:
+                neighbors[node] = group
+
+        indptr = array('I', [0])
+        indices = array('I')
+        for node in range(n_nodes):
+            group = neighbors.get(node, ())
+            indices.extend(other for other in group if other != node)
+            indptr.append(len(indices))
+        return cls(day, indptr, indices)
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    def neighbors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+
+class ContactGraphWriter:
+    def __init__(self, path, n_nodes):
+        self.n_nodes = n_nodes
+        self.file = open(path, 'wb')
+        self.file.write(HEADER.pack(MAGIC, n_nodes))
+
+    def record(self, day, groups):
+        self.write(ContactGraph.from_groups(day, self.n_nodes, groups))
+
+    def write(self, graph):
+        indptr = zlib.compress(graph.indptr.tobytes())
+        indices = zlib.compress(graph.indices.tobytes())
+        self.file.write(DAY_HEADER.pack(graph.day, graph.n_edges, len(indptr), len(indices)))
+        self.file.write(indptr)
+        self.file.write(indices)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ContactGraphReader:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, self.n_nodes = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('{} is not a contact graph file'.format(path))
+
+    def __iter__(self):
+        with open(self.path, 'rb') as f:
+            f.seek(HEADER.size)
+            while True:
+                header = f.read(DAY_HEADER.size)
+                if not header:
+                    return
+                day, _, indptr_size, indices_size = DAY_HEADER.unpack(header)
+                indptr = array('I', zlib.decompress(f.read(indptr_size)))
+                indices = array('I', zlib.decompress(f.read(indices_size)))
+                yield ContactGraph(day, indptr, indices)
+
+
+class ReplaySimulation(Simulation):
+    # reruns disease dynamics over recorded contacts without moving anyone
+    def __init__(self, persons, reader, **kwargs):
+        if reader.n_nodes != len(persons):
+            raise ValueError('Recorded {} persons, got {}'.format(reader.n_nodes, len(persons)))
+        super().__init__(persons, **kwargs)
+        self.graphs = iter(reader)
+        self.graph = None
+
+    def day_phase(self):
+        self.graph = next(self.graphs, None)
+        ill = []
+        for person in self.persons:
+            if person.state.SHOWS_SYMPTOMS:
+                ill.append(person)
+            elif not isinstance(person.state, (Healthy, AsymptomaticSick)):
+                person.day_actions()
+        self.symptoms_phase(ill)
+        self.apply_schedule(TimelineSchedule.DAY)
+
+    def contact_phase(self):
+        infected = []
+        if self.graph is not None:
+            persons = self.persons
+            sick = [i for i, person in enumerate(persons) if isinstance(person.state, SICK_STATES)]
+            for i in sick:
+                for j in self.graph.neighbors(i):
+                    other = persons[j]
+                    if isinstance(other.state, SICK_STATES):
+                        continue
+                    before = other.state
+                    persons[i].interact(other)
+                    if other.state is not before:
+                        infected.append(other)
+        self.on_infected(infected)
+        return infected
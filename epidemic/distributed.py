@@ -0,0 +1,282 @@
+import hmac
+import os
+import pickle
+import random
+import secrets
+import socket
+import struct
+import subprocess
+import sys
+import time
+from bisect import bisect_right
+
+from . import state
+from .infectable import InfectableType, get_pathogen
+from .person import create_persons
+from .simulation import SICK_STATES, count_states, STATE_NAMES
+from .state import Healthy
+
+FRAME = struct.Struct('<Q')
+# workers prove they belong to the run with this shared token before any pickle is exchanged
+TOKEN_VARIABLE = 'EPIDEMIC_TILE_TOKEN'
+TOKEN_BYTES = 32
+
+
+def send_message(sock, message):
+    data = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(FRAME.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = bytearray()
+    while len(chunks) < size:
+        chunk = sock.recv(min(size - len(chunks), 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        chunks += chunk
+    return bytes(chunks)
+
+
+def recv_message(sock):
+    size, = FRAME.unpack(_recv_exactly(sock, FRAME.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+
+def virus_spec(virus):
+    return virus.get_type().value, virus.strength, virus.contag
+
+
+def virus_from_spec(spec):
+    infectable_type, strength, contag = spec
+    return get_pathogen(InfectableType(infectable_type))(strength=strength, contag=contag)
+
+
+def _split(low, high, parts):
+    # inclusive [low, high] range cut into parts contiguous blocks
+    size = high - low + 1
+    if not 0 < parts <= size:
+        raise ValueError('Cannot split {} cells into {} tiles'.format(size, parts))
+    edges = [low + size * part // parts for part in range(parts + 1)]
+    return [(edges[part], edges[part + 1] - 1) for part in range(parts)]
+
+
+class TileGrid:
+    def __init__(self, grid, tiles):
+        self.grid = grid
+        min_j, max_j, min_i, max_i = grid
+        self.j_blocks = _split(min_j, max_j, tiles[0])
+        self.i_blocks = _split(min_i, max_i, tiles[1])
+        self.j_starts = [low for low, _ in self.j_blocks]
+        self.i_starts = [low for low, _ in self.i_blocks]
+
+    def __len__(self):
+        return len(self.j_blocks) * len(self.i_blocks)
+
+    def bounds(self, tile):
+        j_block, i_block = divmod(tile, len(self.i_blocks))
+        return self.j_blocks[j_block] + self.i_blocks[i_block]
+
+    def area(self, tile):
+        min_j, max_j, min_i, max_i = self.bounds(tile)
+        return (max_j - min_j + 1) * (max_i - min_i + 1)
+
+    def tile_of(self, position):
+        j, i = position
+        return (bisect_right(self.j_starts, j) - 1) * len(self.i_blocks) + bisect_right(self.i_starts, i) - 1
+
+    def split_population(self, n_persons):
+        # largest remainder so that the tiles add up to n_persons
+        total = sum(self.area(tile) for tile in range(len(self)))
+        shares = [n_persons * self.area(tile) / total for tile in range(len(self))]
+        counts = [int(share) for share in shares]
+        by_remainder = sorted(range(len(self)), key=lambda tile: counts[tile] - shares[tile])
+        for tile in by_remainder[:n_persons - sum(counts)]:
+            counts[tile] += 1
+        return counts
+
+
+class TileWorker:
+    def __init__(self, sock):
+        self.sock = sock
+
+    def setup(self, config):
+        self.tile = config['tile']
+        self.tiles = TileGrid(config['grid'], config['tiles'])
+        state.set_grid(*config['grid'])
+        random.seed('{}-{}'.format(config['seed'], self.tile))
+
+        min_j, max_j, min_i, max_i = self.tiles.bounds(self.tile)
+        self.persons = create_persons(min_j, max_j, min_i, max_i, config['n_persons'])
+        self.ids = list(range(config['id_offset'], config['id_offset'] + config['n_persons']))
+        self.by_id = dict(zip(self.ids, self.persons))
+        for person_id, spec in config['infected']:
+            if person_id in self.by_id:
+                self.by_id[person_id].get_infected(virus_from_spec(spec))
+
+    def day(self):
+        # the first carrier of every pathogen in each cell, by person id; only the sick leave the worker
+        carriers = {}
+        for person_id, person in zip(self.ids, self.persons):
+            person.day_actions()
+            if isinstance(person.state, SICK_STATES):
+                cell = carriers.setdefault(person.position, {})
+                cell.setdefault(person.virus.get_type().value, (person_id, virus_spec(person.virus)))
+        return carriers
+
+    def night(self, carriers):
+        # the agents of this worker meet the carriers of all tiles in their cell, as in Simulation.transmit
+        for person in self.persons:
+            specs = carriers.get(person.position)
+            if specs and isinstance(person.state, Healthy):
+                for spec in specs:
+                    if InfectableType(spec[0]) not in person.antibody_types:
+                        person.get_infected(virus_from_spec(spec))
+                        break
+        for person in self.persons:
+            person.night_actions()
+        return count_states(self.persons)
+
+    def serve(self):
+        while True:
+            message = recv_message(self.sock)
+            command = message[0]
+            if command == 'setup':
+                self.setup(message[1])
+                send_message(self.sock, ('ready', len(self.persons)))
+            elif command == 'day':
+                send_message(self.sock, ('carriers', self.day()))
+            elif command == 'night':
+                send_message(self.sock, ('counts', self.night(message[1])))
+            elif command == 'stop':
+                return
+            else:
+                raise ValueError('Unknown command {}'.format(command))
+
+
+def run_worker(host, port, token):
+    with socket.create_connection((host, port)) as sock:
+        sock.sendall(bytes.fromhex(token))
+        TileWorker(sock).serve()
+
+
+class TileCoordinator:
+    HOST = '127.0.0.1'
+
+    CONNECT_TIMEOUT = 30.0
+
+    def __init__(self, n_persons, days=100, tiles=(2, 2), grid=None, seed=0, infected=(),
+                 host=HOST, port=0, spawn_workers=True, token=None, connect_timeout=CONNECT_TIMEOUT):
+        self.n_persons = n_persons
+        self.days = days
+        self.tiles = tiles
+        self.grid = grid if grid is not None else (state.min_j, state.max_j, state.min_i, state.max_i)
+        self.tile_grid = TileGrid(self.grid, tiles)
+        self.seed = seed
+        # (person id, virus) pairs infected before the first day
+        self.infected = [(person_id, virus_spec(virus)) for person_id, virus in infected]
+        self.host = host
+        self.port = port
+        self.spawn_workers = spawn_workers
+        # hex token, workers started elsewhere get it through the EPIDEMIC_TILE_TOKEN variable
+        self.token = token if token is not None else secrets.token_hex(TOKEN_BYTES)
+        if len(bytes.fromhex(self.token)) != TOKEN_BYTES:
+            raise ValueError('token must be {} hex encoded bytes'.format(TOKEN_BYTES))
+        self.connect_timeout = connect_timeout
+        self.history = []
+
+    def _broadcast(self, sockets, messages):
+        for sock, message in zip(sockets, messages):
+            send_message(sock, message)
+        return [recv_message(sock)[1] for sock in sockets]
+
+    def _start(self, server, processes, sockets):
+        if self.spawn_workers:
+            host, port = server.getsockname()
+            env = dict(os.environ)
+            root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+            env['PYTHONPATH'] = os.pathsep.join(filter(None, [root, env.get('PYTHONPATH')]))
+            env[TOKEN_VARIABLE] = self.token
+            command = [sys.executable, '-m', 'epidemic.distributed', 'worker', host, str(port)]
+            for _ in range(len(self.tile_grid)):
+                processes.append(subprocess.Popen(command, env=env))
+
+        expected = bytes.fromhex(self.token)
+        deadline = time.monotonic() + self.connect_timeout
+        while len(sockets) < len(self.tile_grid):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError('Only {} of {} tile workers connected'.format(len(sockets), len(self.tile_grid)))
+            server.settimeout(remaining)
+            try:
+                sock = server.accept()[0]
+            except socket.timeout:
+                continue
+            # connections without the token are dropped unread
+            sock.settimeout(max(0.0, deadline - time.monotonic()))
+            try:
+                authenticated = hmac.compare_digest(_recv_exactly(sock, TOKEN_BYTES), expected)
+            except OSError:
+                authenticated = False
+            if not authenticated:
+                sock.close()
+                continue
+            sock.settimeout(None)
+            sockets.append(sock)
+
+    def run(self):
+        counts = self.tile_grid.split_population(self.n_persons)
+        offsets = [sum(counts[:tile]) for tile in range(len(counts))]
+        processes, sockets = [], []
+        with socket.create_server((self.host, self.port)) as server:
+            try:
+                self._start(server, processes, sockets)
+                self._broadcast(sockets, [('setup', {
+                    'tile': tile, 'grid': self.grid, 'tiles': self.tiles, 'seed': self.seed,
+                    'n_persons': counts[tile], 'id_offset': offsets[tile], 'infected': self.infected,
+                }) for tile in range(len(sockets))])
+
+                for _ in range(self.days):
+                    # agents stay with the worker of their home tile wherever they go, only the carriers
+                    # of each occupied cell are exchanged, so nothing here grows with the population
+                    carriers = {}
+                    for tile_carriers in self._broadcast(sockets, [('day',)] * len(sockets)):
+                        for position, cell in tile_carriers.items():
+                            merged = carriers.setdefault(position, {})
+                            for infectable_type, carrier in cell.items():
+                                if infectable_type not in merged or carrier[0] < merged[infectable_type][0]:
+                                    merged[infectable_type] = carrier
+                    carriers = {position: [spec for _, spec in sorted(cell.values())]
+                                for position, cell in carriers.items()}
+
+                    totals = dict.fromkeys(STATE_NAMES, 0)
+                    for tile_counts in self._broadcast(sockets, [('night', carriers)] * len(sockets)):
+                        for name, count in tile_counts.items():
+                            totals[name] += count
+                    self.history.append(totals)
+            except BaseException:
+                # workers of a failed run are not waited for
+                for process in processes:
+                    process.kill()
+                raise
+            finally:
+                for sock in sockets:
+                    try:
+                        send_message(sock, ('stop',))
+                    except OSError:
+                        pass
+                    sock.close()
+                for process in processes:
+                    try:
+                        process.wait(self.connect_timeout)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+                        process.wait()
+        return self.history
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4 or sys.argv[1] != 'worker':
+        sys.exit('usage: python -m epidemic.distributed worker HOST PORT')
+    if TOKEN_VARIABLE not in os.environ:
+        sys.exit('{} must hold the token of the coordinator'.format(TOKEN_VARIABLE))
+    run_worker(sys.argv[2], int(sys.argv[3]), os.environ[TOKEN_VARIABLE])
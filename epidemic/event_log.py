@@ -0,0 +1,182 @@
+import struct
+from array import array
+from ast import literal_eval
+from bisect import bisect_right
+from enum import Enum
+
+MAGIC = b'EVL2'
+# magic, number of agents, 1 if there is a seed, length of the seed's repr that follows the header
+HEADER = struct.Struct('<4sIBH')
+RECORD = struct.Struct('<IIBB')
+INDEX_ENTRY = struct.Struct('<IQ')
+SEED_TYPES = (int, float, str, bytes)
+
+
+class EventType(Enum):
+    Infection = 1
+    SymptomOnset = 2
+    Recovery = 3
+    Death = 4
+    Hospitalization = 5
+
+
+STATE_CODES = {'Healthy': 0, 'AsymptomaticSick': 1, 'SymptomaticSick': 2, 'Dead': 3}
+STATE_NAMES = tuple(STATE_CODES)
+
+_EVENT_STATES = {
+    EventType.Infection.value: STATE_CODES['AsymptomaticSick'],
+    EventType.SymptomOnset.value: STATE_CODES['SymptomaticSick'],
+    EventType.Recovery.value: STATE_CODES['Healthy'],
+    EventType.Death.value: STATE_CODES['Dead'],
+}
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def encode_seed(seed):
+    # any seed random.seed accepts is kept as its repr, so it reads back exactly
+    if seed is None:
+        return b'', 0
+    if isinstance(seed, bytearray):
+        seed = bytes(seed)
+    if isinstance(seed, bool) or not isinstance(seed, SEED_TYPES):
+        raise ValueError('Cannot log a seed of type {}'.format(type(seed).__name__))
+    text = repr(seed).encode()
+    if len(text) > 0xFFFF or literal_eval(text.decode()) != seed:
+        raise ValueError('Cannot log the seed {!r}'.format(seed))
+    return text, 1
+
+
+class EventLogWriter:
+    BATCH_SIZE = 4096
+
+    def __init__(self, path, n_agents, seed=None, batch_size=BATCH_SIZE):
+        # checked before the file is created, so a bad seed leaves no partial log behind
+        seed_text, has_seed = encode_seed(seed)
+        header = HEADER.pack(MAGIC, n_agents, has_seed, len(seed_text)) + seed_text
+        self.path = path
+        self.batch_size = batch_size
+        self.buffer = bytearray()
+        self.pending = 0
+        self.day = None
+        self.index = []
+        self.file = open(path, 'wb')
+        self.file.write(header)
+        self.offset = len(header)
+
+    def notify(self, day, agent, event_type, infectable_type):
+        if day != self.day:
+            if self.day is not None and day < self.day:
+                raise ValueError('Events must be appended in day order')
+            self.day = day
+            self.index.append((day, self.offset + len(self.buffer)))
+        pathogen = 0 if infectable_type is None else infectable_type.value
+        self.buffer += RECORD.pack(day, agent, event_type.value, pathogen)
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(self.buffer)
+        self.offset += len(self.buffer)
+        self.buffer.clear()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        with open(index_path(self.path), 'wb') as f:
+            for entry in self.index:
+                f.write(INDEX_ENTRY.pack(*entry))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PopulationSnapshot:
+    def __init__(self, n_agents):
+        self.states = array('B', bytes(n_agents))
+        self.pathogens = array('B', bytes(n_agents))
+        # bit (value - 1) is set for every infectable type the agent has antibodies to
+        self.antibodies = array('B', bytes(n_agents))
+        self.hospitalized = array('B', bytes(n_agents))
+
+    def apply(self, data):
+        states, pathogens, antibodies, hospitalized = \
+            self.states, self.pathogens, self.antibodies, self.hospitalized
+        for _, agent, event, pathogen in RECORD.iter_unpack(data):
+            if event == EventType.Hospitalization.value:
+                hospitalized[agent] = 1
+                continue
+            states[agent] = _EVENT_STATES[event]
+            if event == EventType.Infection.value:
+                pathogens[agent] = pathogen
+            elif event == EventType.Recovery.value:
+                antibodies[agent] |= 1 << (pathogen - 1)
+                pathogens[agent] = 0
+                hospitalized[agent] = 0
+
+    def counts(self):
+        counts = dict.fromkeys(STATE_NAMES, 0)
+        for code in self.states:
+            counts[STATE_NAMES[code]] += 1
+        return counts
+
+
+class EventLogReader:
+    CHUNK_RECORDS = 65536
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) != HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError('{} is not an event log'.format(path))
+            _, self.n_agents, has_seed, seed_length = HEADER.unpack(header)
+            seed_text = f.read(seed_length)
+            # records start right after the seed
+            self.start = f.tell()
+            f.seek(0, 2)
+            self.size = f.tell()
+        self.seed = literal_eval(seed_text.decode()) if has_seed else None
+
+        self.days = array('I')
+        self.offsets = array('Q')
+        with open(index_path(path), 'rb') as f:
+            for day, offset in INDEX_ENTRY.iter_unpack(f.read()):
+                self.days.append(day)
+                self.offsets.append(offset)
+
+    def _offset_after(self, day):
+        position = bisect_right(self.days, day)
+        return self.offsets[position] if position < len(self.offsets) else self.size
+
+    def _offset_of(self, day):
+        position = bisect_right(self.days, day - 1)
+        return self.offsets[position] if position < len(self.offsets) else self.size
+
+    def _read(self, start, end):
+        with open(self.path, 'rb') as f:
+            f.seek(start)
+            return f.read(end - start)
+
+    def events(self, day):
+        data = self._read(self._offset_of(day), self._offset_after(day))
+        return [(day, agent, EventType(event), pathogen)
+                for day, agent, event, pathogen in RECORD.iter_unpack(data)]
+
+    def state_at(self, day):
+        snapshot = PopulationSnapshot(self.n_agents)
+        remaining = self._offset_after(day) - self.start
+        with open(self.path, 'rb') as f:
+            f.seek(self.start)
+            while remaining > 0:
+                data = f.read(min(remaining, self.CHUNK_RECORDS * RECORD.size))
+                snapshot.apply(data)
+                remaining -= len(data)
+        return snapshot
@@ -0,0 +1,43 @@
+from collections import Counter, defaultdict
+from .state import AsymptomaticSick, SymptomaticSick, Dead
+
+
+class HouseholdIndex:
+    # home_position -> indices of the living residents, and the homes of the sick; the simulation adds
+    # whoever it infects and update() drops the recovered and the dead, so the work follows the sick only
+    def __init__(self, persons):
+        self.persons = persons
+        self.members = defaultdict(list)
+        for index, person in enumerate(persons):
+            self.members[person.home_position].append(index)
+        self.sick = set()
+        self.infectious = Counter()
+        for index, person in enumerate(persons):
+            if isinstance(person.state, (AsymptomaticSick, SymptomaticSick)):
+                self.add(index)
+
+    def add(self, index):
+        if index not in self.sick:
+            self.sick.add(index)
+            self.infectious[self.persons[index].home_position] += 1
+
+    def update(self):
+        for index in list(self.sick):
+            person = self.persons[index]
+            if isinstance(person.state, (AsymptomaticSick, SymptomaticSick)):
+                continue
+            home = person.home_position
+            self.sick.remove(index)
+            self.infectious[home] -= 1
+            if not self.infectious[home]:
+                del self.infectious[home]
+            if isinstance(person.state, Dead):
+                self.members[home].remove(index)
+                if not self.members[home]:
+                    del self.members[home]
+
+    def infected_households(self):
+        for home in self.infectious:
+            members = self.members.get(home, ())
+            if len(members) > 1:
+                yield members
@@ -0,0 +1,84 @@
+from array import array
+from collections import deque
+
+CUMULATIVE = 'cumulative'
+ROLLING = 'rolling'
+VIEWS = (CUMULATIVE, ROLLING)
+
+
+class IncidenceMap:
+    # infections per grid cell, counted as they happen; level l of the pyramid sums 2^l x 2^l cells,
+    # so coarse maps of large grids are kept up to date without ever scanning the finest one
+    def __init__(self, grid, window=7, levels=1):
+        if window < 1 or levels < 1:
+            raise ValueError('window and levels must be at least 1')
+        self.min_j, max_j, self.min_i, max_i = grid
+        self.height = max_j - self.min_j + 1
+        self.width = max_i - self.min_i + 1
+        if self.height < 1 or self.width < 1:
+            raise ValueError('grid must be [min_j, max_j, min_i, max_i]')
+        self.window = window
+        self.levels = levels
+        self.day = 0
+        # infections outside the grid are only counted
+        self.outside = 0
+        self.counts = {view: [array('L', [0]) * (h * w) for h, w in map(self.shape, range(levels))]
+                       for view in VIEWS}
+        # infections per cell of the days still in the window, today last
+        self.days = deque([{}])
+
+    def shape(self, level=0):
+        # rows and columns, rounded up
+        return -(-self.height >> level), -(-self.width >> level)
+
+    def update(self, view, j, i, count):
+        for level, counts in enumerate(self.counts[view]):
+            counts[(j >> level) * -(-self.width >> level) + (i >> level)] += count
+
+    def add(self, j, i, count=1):
+        j -= self.min_j
+        i -= self.min_i
+        if not (0 <= j < self.height and 0 <= i < self.width):
+            self.outside += count
+            return
+        today = self.days[-1]
+        today[j, i] = today.get((j, i), 0) + count
+        self.update(CUMULATIVE, j, i, count)
+        self.update(ROLLING, j, i, count)
+
+    def record(self, positions):
+        for j, i in positions:
+            self.add(j, i)
+
+    def end_day(self):
+        # the rolling view keeps the last `window` finished days and what happened today so far
+        self.day += 1
+        self.days.append({})
+        if len(self.days) > self.window + 1:
+            for (j, i), count in self.days.popleft().items():
+                self.update(ROLLING, j, i, -count)
+
+    def view(self, view=CUMULATIVE, level=0):
+        if view not in VIEWS:
+            raise ValueError('Unknown view {}'.format(view))
+        if not 0 <= level < self.levels:
+            raise ValueError('level must be within [0, {}]'.format(self.levels - 1))
+        return array('L', self.counts[view][level])
+
+    def to_rows(self, view=CUMULATIVE, level=0):
+        counts = self.view(view, level)
+        width = self.shape(level)[1]
+        return [counts[start:start + width].tolist() for start in range(0, len(counts), width)]
+
+    def total(self, view=CUMULATIVE):
+        return sum(self.counts[view][-1])
+
+    def export(self):
+        return {
+            'grid': [self.min_j, self.min_j + self.height - 1, self.min_i, self.min_i + self.width - 1],
+            'day': self.day,
+            'window': self.window,
+            'outside': self.outside,
+            CUMULATIVE: [self.to_rows(CUMULATIVE, level) for level in range(self.levels)],
+            ROLLING: [self.to_rows(ROLLING, level) for level in range(self.levels)],
+        }
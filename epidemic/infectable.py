@@ -0,0 +1,138 @@
+from enum import Enum
+from abc import ABC
+from random import expovariate, uniform, randint
+
+
+class Infectable(ABC):
+    TEMPERATURE_PER_DAY = 0.0
+    WATER_PER_DAY = 0.0
+    # strength and contag of new viruses are exponential with these rates
+    STRENGTH_RATE = 1.0
+    CONTAG_RATE = 1.0
+    # strength lost every night by someone of age 1, older people lose it slower
+    RECOVERY_PER_DAY = 3.0
+
+    def __init__(self, strength=1.0, contag=1.0):
+        # contag is for contagiousness so we have less typos
+        self.strength = strength
+        self.contag = contag
+
+    def cause_symptoms(self, person):
+        type(self).cause_symptoms_persons([person])
+
+    @classmethod
+    def cause_symptoms_persons(cls, persons):
+        # the column kernel on the temperature and water of Person objects, so a pathogen declares its symptoms once
+        temperature = [person.temperature for person in persons]
+        water = [person.water for person in persons]
+        cls.cause_symptoms_columns(temperature, water, range(len(persons)))
+        for person, person_temperature, person_water in zip(persons, temperature, water):
+            person.temperature = person_temperature
+            person.water = person_water
+
+    @classmethod
+    def create(cls):
+        return cls(strength=expovariate(cls.STRENGTH_RATE), contag=expovariate(cls.CONTAG_RATE))
+
+    @classmethod
+    def cause_symptoms_columns(cls, temperature, water, indices):
+        # cause_symptoms for every person in indices at once, on temperature and water columns
+        if cls.TEMPERATURE_PER_DAY:
+            for index in indices:
+                temperature[index] += cls.TEMPERATURE_PER_DAY
+        if cls.WATER_PER_DAY:
+            for index in indices:
+                water[index] -= cls.WATER_PER_DAY
+
+    @classmethod
+    def symptoms_per_day(cls):
+        # daily change of temperature and water loss, as the closed-form timeline needs them
+        temperature, water = [0.0], [0.0]
+        cls.cause_symptoms_columns(temperature, water, (0,))
+        return temperature[0], -water[0]
+
+    @classmethod
+    def fight_virus_columns(cls, strength, age, indices):
+        # fight_virus for every person in indices at once, returns those who beat the virus
+        recovered = []
+        for index in indices:
+            strength[index] -= cls.RECOVERY_PER_DAY / age[index]
+            if strength[index] <= 0:
+                recovered.append(index)
+        return recovered
+
+    
+class SeasonalFluVirus(Infectable):
+    TEMPERATURE_PER_DAY = 0.25
+    STRENGTH_RATE = 10.0
+    CONTAG_RATE = 10.0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.name= 'SeasonalFluVirus'
+
+    def get_type(self):
+        return InfectableType.SeasonalFlu
+
+   
+    
+class SARSCoV2(Infectable):
+    TEMPERATURE_PER_DAY = 0.5
+    STRENGTH_RATE = 2.0
+    CONTAG_RATE = 2.0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.name= 'SARSCoV2'
+
+    def get_type(self):
+        return InfectableType.SARSCoV2
+
+
+class Cholera(Infectable):
+    WATER_PER_DAY = 1.0
+    STRENGTH_RATE = 2.0
+    CONTAG_RATE = 2.0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.name= 'Cholera'
+
+    def get_type(self):
+        return InfectableType.Cholera
+    
+
+class InfectableType(Enum):
+    SeasonalFlu = 1
+    SARSCoV2 = 2
+    Cholera = 3
+
+    
+# the virus class of every InfectableType, engines look pathogens up here instead of branching on the type
+PATHOGENS = {}
+
+
+def register_pathogen(infectable_type, virus_class):
+    if virus_class.cause_symptoms is not Infectable.cause_symptoms:
+        # the engines only run cause_symptoms_columns, an own cause_symptoms would not be seen by them
+        raise ValueError('{} must declare its symptoms in cause_symptoms_columns'.format(virus_class.__name__))
+    if infectable_type in PATHOGENS:
+        raise ValueError('{} is already registered'.format(infectable_type))
+    PATHOGENS[infectable_type] = virus_class
+    return virus_class
+
+
+def get_pathogen(infectable_type):
+    try:
+        return PATHOGENS[infectable_type]
+    except (KeyError, TypeError):
+        raise ValueError('Unknown pathogen type {}'.format(infectable_type)) from None
+
+
+def get_infectable(infectable_type: InfectableType):
+    return get_pathogen(infectable_type).create()
+
+
+register_pathogen(InfectableType.SeasonalFlu, SeasonalFluVirus)
+register_pathogen(InfectableType.SARSCoV2, SARSCoV2)
+register_pathogen(InfectableType.Cholera, Cholera)
@@ -0,0 +1,395 @@
+import random
+from collections import Counter, defaultdict
+from math import exp, floor, log, sqrt
+from . import state
+from .infectable import InfectableType, get_infectable
+from .person import create_persons
+from .simulation import STATE_NAMES, SICK_STATES, state_name
+from .state import Healthy, AsymptomaticSick
+from .timeline import plan_infection, Outcome
+
+EXACT_BINOMIAL_MEAN = 30
+
+
+def antibody_mask(infectable_types):
+    # bit (value - 1) is set for every infectable type, as in CompactPopulation.antibodies
+    return sum(1 << (t.value - 1) for t in infectable_types)
+
+
+def mask_types(mask):
+    return [t for t in InfectableType if mask >> (t.value - 1) & 1]
+
+
+def binomial(n, p):
+    if n <= 0 or p <= 0.0:
+        return 0
+    if p >= 1.0:
+        return n
+    if p > 0.5:
+        return n - binomial(n, 1.0 - p)
+    if n * p < EXACT_BINOMIAL_MEAN:
+        # skip over failures with geometric waiting times, O(n * p) draws
+        count, trial, log_q = 0, 0, log(1.0 - p)
+        while True:
+            trial += floor(log(1.0 - random.random()) / log_q) + 1
+            if trial > n:
+                return count
+            count += 1
+    mean, sd = n * p, sqrt(n * p * (1.0 - p))
+    return min(n, max(0, int(round(random.gauss(mean, sd)))))
+
+
+def multinomial(n, weights):
+    total = float(sum(weights))
+    counts = []
+    for weight in weights:
+        count = binomial(n, weight / total) if total > 0 else 0
+        counts.append(count)
+        n -= count
+        total -= weight
+    return counts
+
+
+class OutcomeTable:
+    # daily death and recovery hazards of the symptomatic phase, estimated with plan_infection
+    SAMPLES = 2000
+
+    def __init__(self, death_hazards, recovery_hazards):
+        self.death_hazards = death_hazards
+        self.recovery_hazards = recovery_hazards
+
+    @classmethod
+    def sample(cls, infectable_type, strength=None, samples=SAMPLES):
+        outcomes = Counter()
+        for person in create_persons(0, 0, 0, 0, samples):
+            virus = get_infectable(infectable_type)
+            if strength is not None:
+                virus.strength = strength
+            person.virus = virus
+            timeline = plan_infection(person)
+            outcomes[timeline.outcome, timeline.outcome_day - timeline.onset] += 1
+
+        last_day = max(day for _, day in outcomes)
+        death_hazards, recovery_hazards = [], []
+        at_risk = samples
+        for day in range(1, last_day + 1):
+            deaths = outcomes[Outcome.DEAD, day]
+            death_hazards.append(deaths / at_risk if at_risk else 0.0)
+            at_risk -= deaths
+            recoveries = outcomes[Outcome.RECOVERED, day]
+            recovery_hazards.append(recoveries / at_risk if at_risk else 1.0)
+            at_risk -= recoveries
+        return cls(death_hazards, recovery_hazards)
+
+    def death_hazard(self, day):
+        return self.death_hazards[day - 1] if day <= len(self.death_hazards) else 0.0
+
+    def recovery_hazard(self, day):
+        return self.recovery_hazards[day - 1] if day <= len(self.recovery_hazards) else 1.0
+
+
+class CellCounts:
+    # the sick are keyed by (pathogen, antibody mask before the infection), so that recovery only adds a bit
+    def __init__(self):
+        # healthy[mask] counts the healthy with exactly these antibodies, healthy[0] the naive
+        self.healthy = Counter()
+        # asymptomatic[t, mask][d] counts those with days_sick == d
+        self.asymptomatic = defaultdict(lambda: [0, 0, 0])
+        # symptomatic[t, mask][k - 1] counts those about to live symptomatic day k
+        self.symptomatic = defaultdict(list)
+        self.dead = 0
+
+    def counts(self):
+        return {
+            'Healthy': sum(self.healthy.values()),
+            'AsymptomaticSick': sum(sum(days) for days in self.asymptomatic.values()),
+            'SymptomaticSick': sum(sum(days) for days in self.symptomatic.values()),
+            'Dead': self.dead,
+        }
+
+
+class Metapopulation:
+    AGENT_THRESHOLD = 0
+
+    def __init__(self, grid, agent_threshold=AGENT_THRESHOLD, strengths=None, samples=OutcomeTable.SAMPLES):
+        self.grid = grid
+        min_j, max_j, min_i, max_i = grid
+        self.width = max_i - min_i + 1
+        self.n_cells = (max_j - min_j + 1) * self.width
+        # cells with fewer residents than this are simulated with agents
+        self.agent_threshold = agent_threshold
+        # optional fixed virus strength per InfectableType, sampled from get_infectable otherwise
+        self.strengths = dict(strengths or {})
+        self.samples = samples
+        self.tables = {}
+        self.cells = {}
+        self.agents = []
+        self.day = 0
+        self.history = []
+
+    def cell_index(self, position):
+        j, i = position
+        return (j - self.grid[0]) * self.width + i - self.grid[2]
+
+    def cell_position(self, index):
+        j, i = divmod(index, self.width)
+        return j + self.grid[0], i + self.grid[2]
+
+    def table(self, infectable_type):
+        if infectable_type not in self.tables:
+            self.tables[infectable_type] = OutcomeTable.sample(
+                infectable_type, self.strengths.get(infectable_type), self.samples)
+        return self.tables[infectable_type]
+
+    def create_virus(self, infectable_type):
+        virus = get_infectable(infectable_type)
+        if infectable_type in self.strengths:
+            virus.strength = self.strengths[infectable_type]
+        return virus
+
+    def populate(self, n_persons):
+        # residents per cell are drawn from a multinomial, agents are only built for small cells
+        remaining_cells = self.n_cells
+        for index in range(self.n_cells):
+            residents = binomial(n_persons, 1.0 / remaining_cells)
+            n_persons -= residents
+            remaining_cells -= 1
+            if residents == 0:
+                continue
+            if residents < self.agent_threshold:
+                j, i = self.cell_position(index)
+                self.agents.extend(create_persons(j, j, i, i, residents))
+            else:
+                self.cells.setdefault(index, CellCounts()).healthy[0] += residents
+
+    def add_persons(self, persons):
+        residents = defaultdict(list)
+        for person in persons:
+            residents[self.cell_index(person.home_position)].append(person)
+        for index, group in residents.items():
+            if len(group) < self.agent_threshold:
+                self.agents.extend(group)
+                continue
+            cell = self.cells.setdefault(index, CellCounts())
+            for person in group:
+                name = state_name(person.state)
+                mask = antibody_mask(person.antibody_types)
+                if name == 'Dead':
+                    cell.dead += 1
+                elif name == 'Healthy':
+                    cell.healthy[mask] += 1
+                elif name == 'AsymptomaticSick':
+                    days_sick = min(person.state.days_sick, AsymptomaticSick.DAYS_SICK_TO_FEEL_BAD)
+                    cell.asymptomatic[person.virus.get_type(), mask][days_sick] += 1
+                else:
+                    self._add_symptomatic(cell, (person.virus.get_type(), mask), 1)
+
+    def infect(self, position, infectable_type, count):
+        cell = self.cells.get(self.cell_index(position))
+        if cell is not None:
+            count = min(count, cell.healthy[0])
+            cell.healthy[0] -= count
+            cell.asymptomatic[infectable_type, 0][0] += count
+            return count
+        infected = 0
+        for person in self.agents:
+            if infected < count and person.home_position == position and isinstance(person.state, Healthy):
+                person.get_infected(self.create_virus(infectable_type))
+                infected += 1
+        return infected
+
+    def naive_residents(self):
+        residents = Counter()
+        for index, cell in self.cells.items():
+            if cell.healthy[0]:
+                residents[self.cell_position(index)] += cell.healthy[0]
+        for person in self.agents:
+            if isinstance(person.state, Healthy) and not person.antibody_types:
+                residents[person.home_position] += 1
+        return residents
+
+    def infect_random(self, infectable_type, count):
+        # count naive residents drawn uniformly from the whole population
+        residents = sorted(self.naive_residents().items())
+        total = sum(n for _, n in residents)
+        chosen = sorted(random.sample(range(total), min(count, total)))
+        infected, start, k = 0, 0, 0
+        for position, n in residents:
+            in_cell = 0
+            while k < len(chosen) and chosen[k] < start + n:
+                in_cell += 1
+                k += 1
+            if in_cell:
+                infected += self.infect(position, infectable_type, in_cell)
+            start += n
+        return infected
+
+    @staticmethod
+    def _add_symptomatic(cell, key, count):
+        days = cell.symptomatic[key]
+        if not days:
+            days.append(0)
+        days[0] += count
+
+    def counts(self):
+        totals = dict.fromkeys(STATE_NAMES, 0)
+        for cell in self.cells.values():
+            for name, count in cell.counts().items():
+                totals[name] += count
+        for person in self.agents:
+            totals[state_name(person.state)] += 1
+        return totals
+
+    def counts_by_type(self):
+        totals = defaultdict(lambda: dict.fromkeys(('AsymptomaticSick', 'SymptomaticSick', 'Immune'), 0))
+        for cell in self.cells.values():
+            immune = Counter(cell.healthy)
+            for name, compartments in (('AsymptomaticSick', cell.asymptomatic), ('SymptomaticSick', cell.symptomatic)):
+                for (infectable_type, mask), days in compartments.items():
+                    totals[infectable_type][name] += sum(days)
+                    immune[mask] += sum(days)
+            for mask, count in immune.items():
+                for infectable_type in mask_types(mask):
+                    totals[infectable_type]['Immune'] += count
+        for person in self.agents:
+            if isinstance(person.state, SICK_STATES):
+                totals[person.virus.get_type()][state_name(person.state)] += 1
+            for infectable_type in person.antibody_types:
+                totals[infectable_type]['Immune'] += 1
+        return dict(totals)
+
+    def day_phase(self):
+        for cell in self.cells.values():
+            for (infectable_type, _), days in cell.symptomatic.items():
+                table = self.table(infectable_type)
+                for k in range(len(days)):
+                    deaths = binomial(days[k], table.death_hazard(k + 1))
+                    days[k] -= deaths
+                    cell.dead += deaths
+        for person in self.agents:
+            person.day_actions()
+
+    def _infectious_cells(self):
+        infectious = defaultdict(set)
+        movers = Counter()
+        for index, cell in self.cells.items():
+            for (infectable_type, _), days in cell.asymptomatic.items():
+                movers[infectable_type] += sum(days)
+            for (infectable_type, _), days in cell.symptomatic.items():
+                if any(days):
+                    infectious[index].add(infectable_type)
+
+        for infectable_type, count in movers.items():
+            if count <= self.n_cells:
+                landed = (random.randrange(self.n_cells) for _ in range(count))
+            else:
+                occupied = 1.0 - exp(-count / self.n_cells)
+                landed = (index for index in range(self.n_cells) if random.random() < occupied)
+            for index in landed:
+                infectious[index].add(infectable_type)
+
+        sources = defaultdict(list)
+        for person in self.agents:
+            if isinstance(person.state, SICK_STATES):
+                index = self.cell_index(person.position)
+                infectious[index].add(person.virus.get_type())
+                sources[person.position].append(person)
+        return infectious, sources
+
+    def _spread(self, n_infected, pool, cells):
+        # hand out infections to the home cells in proportion to their pool, never more than it holds
+        total = sum(pool(cell) for cell in cells)
+        assigned = []
+        for cell in cells:
+            if n_infected <= 0 or total <= 0:
+                break
+            size = pool(cell)
+            count = min(size, binomial(n_infected, size / total))
+            total -= size
+            n_infected -= count
+            assigned.append((cell, count))
+        return assigned
+
+    def contact_phase(self):
+        infectious, sources = self._infectious_cells()
+        signatures = Counter(frozenset(types) for types in infectious.values() if types)
+        signatures = list(signatures.items())
+        cells = list(self.cells.values())
+
+        # the healthy movers of one antibody mask meet every pathogen they have no antibodies for
+        masks = sorted({mask for cell in cells for mask, count in cell.healthy.items() if count})
+        new_infections = []
+        for mask in masks:
+            pool = lambda cell, mask=mask: cell.healthy[mask]
+            susceptible = sum(pool(cell) for cell in cells)
+            landed = multinomial(susceptible, [count for _, count in signatures] + [
+                self.n_cells - sum(count for _, count in signatures)])
+            by_type = Counter()
+            for (types, _), count in zip(signatures, landed):
+                types = sorted((t for t in types if not mask >> (t.value - 1) & 1), key=lambda t: t.value)
+                if types:
+                    for infectable_type, share in zip(types, multinomial(count, [1] * len(types))):
+                        by_type[infectable_type] += share
+            # the infected of all types are spread over the pools once and only then split by type,
+            # so two types never draw the same residents
+            types = sorted(by_type, key=lambda t: t.value)
+            for cell, infected in self._spread(sum(by_type.values()), pool, cells):
+                shares = multinomial(infected, [by_type[t] for t in types])
+                for infectable_type, share in zip(types, shares):
+                    new_infections.append((cell, mask, infectable_type, share))
+
+        for cell, mask, infectable_type, infected in new_infections:
+            cell.healthy[mask] -= infected
+            cell.asymptomatic[infectable_type, mask][0] += infected
+
+        for person in self.agents:
+            if not isinstance(person.state, Healthy):
+                continue
+            types = infectious.get(self.cell_index(person.position))
+            if not types:
+                continue
+            for source in sources.get(person.position, ()):
+                source.interact(person)
+                if not isinstance(person.state, Healthy):
+                    break
+            else:
+                candidates = sorted(types - person.antibody_types, key=lambda t: t.value)
+                if candidates:
+                    person.get_infected(self.create_virus(random.choice(candidates)))
+
+    def night_phase(self):
+        for cell in self.cells.values():
+            for infectable_type, mask in list(cell.symptomatic):
+                days = cell.symptomatic[infectable_type, mask]
+                table = self.table(infectable_type)
+                for k in range(len(days)):
+                    recovered = binomial(days[k], table.recovery_hazard(k + 1))
+                    days[k] -= recovered
+                    # antibodies only accumulate, as antibody_types of an agent
+                    cell.healthy[mask | 1 << (infectable_type.value - 1)] += recovered
+                days.insert(0, 0)
+                while days and days[-1] == 0:
+                    days.pop()
+            for key, days in cell.asymptomatic.items():
+                onset = days[2]
+                days[2], days[1], days[0] = days[1], days[0], 0
+                if onset:
+                    self._add_symptomatic(cell, key, onset)
+        for person in self.agents:
+            person.night_actions()
+
+    def step(self):
+        previous = state.set_grid(*self.grid)
+        try:
+            self.day_phase()
+            self.contact_phase()
+            self.night_phase()
+        finally:
+            state.set_grid(*previous)
+        self.history.append(self.counts())
+        self.day += 1
+
+    def run(self, days):
+        for _ in range(days):
+            self.step()
+        return self.history
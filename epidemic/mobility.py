@@ -0,0 +1,184 @@
+import os
+import random
+import struct
+import zlib
+from array import array
+from collections import defaultdict
+from .state import Healthy, AsymptomaticSick
+from .simulation import Simulation
+from .timeline import TimelineSchedule
+
+MAGIC = b'MOBS'
+HEADER = struct.Struct('<4sIIiiii')
+PLAN_HEADER = struct.Struct('<III')
+MOBILE_STATES = (Healthy, AsymptomaticSick)
+
+
+class DailyPlan:
+    # everyone's daytime cell plus the cell -> residents index in compressed sparse row form
+    def __init__(self, grid, cells, offsets, order):
+        self.grid = grid
+        self.cells = cells
+        self.offsets = offsets
+        self.order = order
+        self._positions = None
+        self._groups = None
+
+    @classmethod
+    def from_cells(cls, grid, cells):
+        min_j, max_j, min_i, max_i = grid
+        n_cells = (max_j - min_j + 1) * (max_i - min_i + 1)
+        offsets = array('I', bytes(4 * (n_cells + 1)))
+        for cell in cells:
+            offsets[cell + 1] += 1
+        for cell in range(n_cells):
+            offsets[cell + 1] += offsets[cell]
+        order = array('I', bytes(4 * len(cells)))
+        filled = array('I', offsets)
+        for index, cell in enumerate(cells):
+            order[filled[cell]] = index
+            filled[cell] += 1
+        return cls(grid, cells, offsets, order)
+
+    @property
+    def n_cells(self):
+        return len(self.offsets) - 1
+
+    def position(self, cell):
+        min_j, max_j, min_i, max_i = self.grid
+        j, i = divmod(cell, max_i - min_i + 1)
+        return j + min_j, i + min_i
+
+    def positions(self):
+        if self._positions is None:
+            # one shared tuple per cell
+            table = [self.position(cell) for cell in range(self.n_cells)]
+            self._positions = [table[cell] for cell in self.cells]
+        return self._positions
+
+    def members(self, cell):
+        return self.order[self.offsets[cell]:self.offsets[cell + 1]]
+
+    def occupancy(self):
+        offsets = self.offsets
+        for cell in range(self.n_cells):
+            if offsets[cell + 1] > offsets[cell]:
+                yield cell, self.members(cell)
+
+    def groups(self):
+        if self._groups is None:
+            self._groups = [list(members) for _, members in self.occupancy() if len(members) > 1]
+        return self._groups
+
+
+class MobilitySchedule:
+    # K daily plans drawn once, day d follows plan pattern[d % len(pattern)]
+    def __init__(self, grid, plans, pattern=None):
+        self.grid = tuple(grid)
+        self.plans = plans
+        self.pattern = list(pattern) if pattern is not None else list(range(len(plans)))
+        for index in self.pattern:
+            if not 0 <= index < len(plans):
+                raise ValueError('No plan {} in a schedule of {}'.format(index, len(plans)))
+
+    @property
+    def n_persons(self):
+        return len(self.plans[0].cells) if self.plans else 0
+
+    def plan(self, day):
+        return self.plans[self.pattern[day % len(self.pattern)]]
+
+    @classmethod
+    def build(cls, grid, n_persons, n_plans, seed=None, pattern=None):
+        # a private generator keeps the simulation's random stream untouched
+        generator = random.Random(seed)
+        min_j, max_j, min_i, max_i = grid
+        n_cells = (max_j - min_j + 1) * (max_i - min_i + 1)
+        plans = []
+        for _ in range(n_plans):
+            cells = array('I', (generator.randrange(n_cells) for _ in range(n_persons)))
+            plans.append(DailyPlan.from_cells(tuple(grid), cells))
+        return cls(grid, plans, pattern)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.n_persons, len(self.plans), *self.grid))
+            for plan in self.plans:
+                chunks = [zlib.compress(values.tobytes()) for values in (plan.cells, plan.offsets, plan.order)]
+                f.write(PLAN_HEADER.pack(*(len(chunk) for chunk in chunks)))
+                for chunk in chunks:
+                    f.write(chunk)
+
+    @classmethod
+    def load(cls, path, pattern=None):
+        with open(path, 'rb') as f:
+            magic, _, n_plans, *grid = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError('{} is not a mobility schedule file'.format(path))
+            plans = []
+            for _ in range(n_plans):
+                sizes = PLAN_HEADER.unpack(f.read(PLAN_HEADER.size))
+                cells, offsets, order = (array('I', zlib.decompress(f.read(size))) for size in sizes)
+                plans.append(DailyPlan(tuple(grid), cells, offsets, order))
+        return cls(grid, plans, pattern)
+
+    @classmethod
+    def cached(cls, directory, grid, n_persons, n_plans, seed=0, pattern=None):
+        name = 'mobility-{}-{}-{}-{}.bin'.format(n_persons, n_plans, seed, '_'.join(map(str, grid)))
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            return cls.load(path, pattern)
+        schedule = cls.build(grid, n_persons, n_plans, seed, pattern)
+        # ensemble members may share the directory, so the file appears in one step
+        partial = '{}.{}.tmp'.format(path, os.getpid())
+        schedule.save(partial)
+        os.replace(partial, path)
+        return schedule
+
+
+class ScheduledSimulation(Simulation):
+    # people on the move follow the day's plan instead of drawing random positions
+    def __init__(self, persons, mobility, **kwargs):
+        if mobility.n_persons != len(persons):
+            raise ValueError('Schedule for {} persons, got {}'.format(mobility.n_persons, len(persons)))
+        super().__init__(persons, **kwargs)
+        self.mobility = mobility
+
+    def day_phase(self):
+        positions = self.mobility.plan(self.day).positions()
+        ill = []
+        for index, person in enumerate(self.persons):
+            if isinstance(person.state, MOBILE_STATES):
+                person.position = positions[index]
+            elif person.state.SHOWS_SYMPTOMS:
+                ill.append(person)
+            else:
+                person.day_actions()
+        self.symptoms_phase(ill)
+        self.apply_schedule(TimelineSchedule.DAY)
+        self.apply_policies()
+
+    def colocated_groups(self):
+        plan = self.mobility.plan(self.day)
+        positions = plan.positions()
+        strays = {}
+        for index, person in enumerate(self.persons):
+            if person.position != positions[index]:
+                strays[index] = person.position
+        if not strays:
+            return plan.groups()
+
+        # the sick in bed, the dead and those sent home are not where the plan puts them
+        extra = defaultdict(list)
+        for index, position in strays.items():
+            extra[position].append(index)
+        groups = []
+        for cell, members in plan.occupancy():
+            members = [index for index in members if index not in strays]
+            position = plan.position(cell)
+            if position in extra:
+                members = sorted(members + extra.pop(position))
+            if len(members) > 1:
+                groups.append(members)
+        groups.extend(group for group in extra.values() if len(group) > 1)
+        return groups
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
-from State import Healthy
+from random import randint
+from .state import Healthy
+from .proximity import distance
 
 class Person(ABC):
     MAX_TEMPERATURE_TO_SURVIVE = 44.0
@@ -32,8 +34,10 @@ class Person(ABC):
     @abstractmethod
     def get_infected(self, virus): pass
     
-    def is_contacting(self, other):
-        return self.position == other.position
+    def is_contacting(self, other, radius=0):
+        if radius <= 0:
+            return self.position == other.position
+        return distance(self.position, other.position) <= radius
     
     @abstractmethod
     def fight_virus(self): pass
@@ -67,12 +71,14 @@ class DefaultPerson(Person):
     def get_infected(self, virus):
         self.state.get_infected(virus)
     
-    def is_contacting(self, other):
-        return self.position == other.position
+    def is_contacting(self, other, radius=0):
+        if radius <= 0:
+            return self.position == other.position
+        return distance(self.position, other.position) <= radius
     
     def fight_virus(self):
         if self.virus:
-            self.virus.strength -= (3.0 / self.age)
+            self.virus.strength -= (self.virus.RECOVERY_PER_DAY / self.age)
         
     def progress_disease(self):
         if self.virus:
@@ -99,12 +105,14 @@ class CommunityPerson(Person):
     def get_infected(self, virus):
         self.state.get_infected(virus)
     
-    def is_contacting(self, other):
-        return self.position == other.position
+    def is_contacting(self, other, radius=0):
+        if radius <= 0:
+            return self.position == other.position
+        return distance(self.position, other.position) <= radius
     
     def fight_virus(self):
         if self.virus:
-            self.virus.strength -= (3.0 / self.age)
+            self.virus.strength -= (self.virus.RECOVERY_PER_DAY / self.age)
         
     def progress_disease(self):
         if self.virus:
@@ -114,3 +122,16 @@ class CommunityPerson(Person):
 
         self.state = state
 
+
+def create_persons(min_j, max_j, min_i, max_i, n_persons):
+    min_age, max_age = 1, 90
+    min_weight, max_weight = 30, 120
+    persons = [
+        DefaultPerson(
+            home_position=(randint(min_j, max_j), randint(min_i, max_i)),
+            age=randint(min_age, max_age),
+            weight=randint(min_weight, max_weight),
+        )
+        for i in range(n_persons)
+    ]
+    return persons
@@ -0,0 +1,63 @@
+import random
+from collections import defaultdict
+from math import exp, floor, hypot
+from .state import Healthy
+
+NEIGHBOR_BUCKETS = [(dj, di) for dj in (-1, 0, 1) for di in (-1, 0, 1)]
+
+
+def distance(position, other):
+    return hypot(position[0] - other[0], position[1] - other[1])
+
+
+def transmission_probability(distance, decay):
+    # exact-cell contacts always transmit, as in the original model
+    return exp(-distance / decay) if distance > 0 else 1.0
+
+
+class CellList:
+    # buckets as wide as the radius, so everyone within it is in the 3x3 buckets around
+    def __init__(self, radius):
+        if radius <= 0:
+            raise ValueError('radius must be positive')
+        self.radius = radius
+        self.buckets = defaultdict(list)
+
+    def bucket(self, position):
+        return floor(position[0] / self.radius), floor(position[1] / self.radius)
+
+    def add(self, index, position):
+        self.buckets[self.bucket(position)].append((index, position))
+
+    def near(self, position):
+        bucket_j, bucket_i = self.bucket(position)
+        found = []
+        for dj, di in NEIGHBOR_BUCKETS:
+            for index, other in self.buckets.get((bucket_j + dj, bucket_i + di), ()):
+                d = distance(position, other)
+                if d <= self.radius:
+                    found.append((index, d))
+        found.sort()
+        return found
+
+
+def radius_transmit(persons, sick, radius, decay, infected):
+    # the sick in index order try everyone around, each infection happens with a probability decaying
+    # with the distance; only the sick are bucketed, the healthy just look them up
+    cells = CellList(radius)
+    for index in sick:
+        cells.add(index, persons[index].position)
+    for person in persons:
+        if not isinstance(person.state, Healthy):
+            continue
+        for index, d in cells.near(person.position):
+            source = persons[index]
+            if source.virus.get_type() in person.antibody_types:
+                continue
+            probability = transmission_probability(d, decay)
+            if probability >= 1.0 or random.random() < probability:
+                before = person.state
+                source.interact(person)
+                if person.state is not before:
+                    infected.append(person)
+                break
@@ -0,0 +1,187 @@
+from math import exp, lgamma, log, sqrt
+from random import randint
+from statistics import fmean, stdev
+from .person import DefaultPerson
+from .simulation import Simulation, STATE_NAMES, state_name
+
+MIN_AGE, MAX_AGE = 1, 90
+MIN_WEIGHT, MAX_WEIGHT = 30, 120
+
+
+def split_range(low, high, parts):
+    # contiguous, nearly equal integer ranges covering [low, high]
+    size = high - low + 1
+    parts = max(1, min(parts, size))
+    bounds = [low + size * k // parts for k in range(parts + 1)]
+    return [(bounds[k], bounds[k + 1] - 1) for k in range(parts)]
+
+
+def allocate(total, shares):
+    # largest remainder rounding of total * share
+    exact = [total * share for share in shares]
+    counts = [int(value) for value in exact]
+    by_remainder = sorted(range(len(shares)), key=lambda k: counts[k] - exact[k])
+    for k in by_remainder[:total - sum(counts)]:
+        counts[k] += 1
+    return counts
+
+
+def contact_grid(grid, fraction):
+    # a grid with fraction of the cells keeps the people per cell, and so the contact rate, of the full population
+    min_j, max_j, min_i, max_i = grid
+    height, width = max_j - min_j + 1, max_i - min_i + 1
+    target = height * width * fraction
+    best = None
+    for rows in range(1, height + 1):
+        columns = min(width, max(1, round(target / rows)))
+        error = (abs(rows * columns - target), abs(rows / height - columns / width))
+        if best is None or error < best[0]:
+            best = error, rows, columns
+    _, rows, columns = best
+    return min_j, min_j + rows - 1, min_i, min_i + columns - 1
+
+
+class Stratum:
+    def __init__(self, ages, weights, rows, columns, share):
+        self.ages = ages
+        self.weights = weights
+        self.rows = rows
+        self.columns = columns
+        self.share = share
+
+
+class StratifiedSample:
+    # a sample of what create_persons(*grid, n_persons) would build, stratified by age, weight and home region
+    AGE_BINS = 4
+    WEIGHT_BINS = 3
+    REGIONS = 2
+
+    def __init__(self, grid, n_persons, fraction, age_bins=AGE_BINS, weight_bins=WEIGHT_BINS, regions=REGIONS):
+        if not 0.0 < fraction <= 1.0:
+            raise ValueError('fraction must be in (0, 1]')
+        self.grid = tuple(grid)
+        self.n_persons = n_persons
+        self.fraction = fraction
+        self.contact_grid = contact_grid(self.grid, fraction)
+        self.n_sample = max(1, round(n_persons * fraction))
+
+        min_j, max_j, min_i, max_i = self.grid
+        self.strata = []
+        for ages in split_range(MIN_AGE, MAX_AGE, age_bins):
+            for weights in split_range(MIN_WEIGHT, MAX_WEIGHT, weight_bins):
+                for rows in split_range(min_j, max_j, regions):
+                    for columns in split_range(min_i, max_i, regions):
+                        share = 1.0
+                        for (low, high), (full_low, full_high) in zip(
+                                (ages, weights, rows, columns),
+                                ((MIN_AGE, MAX_AGE), (MIN_WEIGHT, MAX_WEIGHT), (min_j, max_j), (min_i, max_i))):
+                            share *= (high - low + 1) / (full_high - full_low + 1)
+                        self.strata.append(Stratum(ages, weights, rows, columns, share))
+        self.sizes = allocate(self.n_sample, [stratum.share for stratum in self.strata])
+
+        # the people in the empty strata are spread over the sampled ones
+        sampled = sum(stratum.share for stratum, size in zip(self.strata, self.sizes) if size)
+        self.stratum_weights = [
+            n_persons * stratum.share / sampled / size if size else 0.0
+            for stratum, size in zip(self.strata, self.sizes)
+        ]
+
+    @property
+    def density_ratio(self):
+        # people per contact cell in the sample relative to the full population
+        min_j, max_j, min_i, max_i = self.grid
+        cells = (max_j - min_j + 1) * (max_i - min_i + 1)
+        min_j, max_j, min_i, max_i = self.contact_grid
+        sample_cells = (max_j - min_j + 1) * (max_i - min_i + 1)
+        return (self.n_sample / sample_cells) / (self.n_persons / cells)
+
+    def to_contact_grid(self, position):
+        j, i = position
+        min_j, max_j, min_i, max_i = self.grid
+        contact_min_j, contact_max_j, contact_min_i, contact_max_i = self.contact_grid
+        j = contact_min_j + (j - min_j) * (contact_max_j - contact_min_j + 1) // (max_j - min_j + 1)
+        i = contact_min_i + (i - min_i) * (contact_max_i - contact_min_i + 1) // (max_i - min_i + 1)
+        return j, i
+
+    def draw(self):
+        persons, weights = [], []
+        for stratum, size, weight in zip(self.strata, self.sizes, self.stratum_weights):
+            for _ in range(size):
+                home = (randint(*stratum.rows), randint(*stratum.columns))
+                persons.append(DefaultPerson(
+                    home_position=self.to_contact_grid(home),
+                    age=randint(*stratum.ages),
+                    weight=randint(*stratum.weights),
+                ))
+                weights.append(weight)
+        return persons, weights
+
+
+class SampledSimulation(Simulation):
+    # history holds the state counts rescaled to the full population
+    def __init__(self, persons, weights, **kwargs):
+        super().__init__(persons, **kwargs)
+        self.weights = weights
+
+    def counts(self):
+        counts = dict.fromkeys(STATE_NAMES, 0.0)
+        for person, weight in zip(self.persons, self.weights):
+            counts[state_name(person.state)] += weight
+        return counts
+
+
+def _incomplete_beta(a, b, x):
+    # regularized incomplete beta I_x(a, b), continued fraction by the modified Lentz method
+    if x <= 0.0 or x >= 1.0:
+        return 0.0 if x <= 0.0 else 1.0
+    if x > (a + 1.0) / (a + b + 2.0):
+        return 1.0 - _incomplete_beta(b, a, 1.0 - x)
+    front = exp(lgamma(a + b) - lgamma(a) - lgamma(b) + a * log(x) + b * log(1.0 - x)) / a
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1.0)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    fraction = d
+    for m in range(1, 300):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+                          -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            fraction *= c * d
+        if abs(c * d - 1.0) < 1e-15:
+            break
+    return front * fraction
+
+
+def student_t_quantile(p, df):
+    # t with P(T <= t) = p for p >= 0.5, by bisection on the Student-t distribution function
+    def cdf(t):
+        return 1.0 - 0.5 * _incomplete_beta(df / 2.0, 0.5, df / (df + t * t))
+
+    low, high = 0.0, 1.0
+    while cdf(high) < p:
+        low, high = high, 2.0 * high
+    for _ in range(100):
+        middle = (low + high) / 2.0
+        if cdf(middle) < p:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2.0
+
+
+def confidence_band(histories, confidence=0.95):
+    # pointwise mean and Student-t confidence interval of the mean over replicate runs
+    t = student_t_quantile(0.5 + confidence / 2.0, len(histories) - 1) if len(histories) > 1 else 0.0
+    mean, lower, upper = [], [], []
+    for day in zip(*histories):
+        mean.append({}), lower.append({}), upper.append({})
+        for name in STATE_NAMES:
+            values = [counts[name] for counts in day]
+            center = fmean(values)
+            half_width = t * stdev(values) / sqrt(len(values)) if len(values) > 1 else 0.0
+            mean[-1][name] = center
+            lower[-1][name] = center - half_width
+            upper[-1][name] = center + half_width
+    return mean, lower, upper
@@ -0,0 +1,332 @@
+import json
+import os
+import random
+from . import state
+from .infectable import InfectableType, get_infectable
+from .person import create_persons
+from .simulation import Simulation, StopReason
+
+
+class Scenario:
+    KEYS = ('population', 'grid', 'pathogens', 'days', 'seed', 'seeds', 'output',
+            'closed_form', 'event_log', 'contact_graph', 'engine', 'agent_threshold', 'households', 'sample',
+            'mobility', 'compact', 'population_file',
+            'contact_radius', 'contact_decay', 'coinfection', 'incidence')
+    ENGINES = ('agents', 'metapopulation')
+
+    def __init__(self, population=100, grid=(0, 100, 0, 100), pathogens=(), days=100, seeds=(None,),
+                 output=None, closed_form=False, event_log=None, contact_graph=None,
+                 engine='agents', agent_threshold=0, households=False, sample=None,
+                 mobility=None, compact=False, population_file=None, contact_radius=0, contact_decay=None,
+                 coinfection=False, incidence=None):
+        self.population = population
+        self.grid = tuple(grid)
+        # [{"type": "SARSCoV2", "infected": 5, "strength": 1.0, "contag": 1.0}, ...]
+        self.pathogens = list(pathogens)
+        self.days = days
+        self.seeds = list(seeds)
+        self.output = output
+        self.closed_form = closed_form
+        # paths may contain {seed} to keep the runs of an ensemble apart
+        self.event_log = event_log
+        self.contact_graph = contact_graph
+        self.engine = engine
+        self.agent_threshold = agent_threshold
+        self.households = households
+        # {"fraction": 0.01, "replicates": 5, "confidence": 0.95, "age_bins": 4, "weight_bins": 3, "regions": 2}
+        self.sample = dict(sample) if sample is not None else None
+        # {"plans": 7, "pattern": [0, 1, 2, 3, 4, 5, 6], "seed": 0, "cache": "schedules/"}
+        self.mobility = dict(mobility) if mobility is not None else None
+        self.schedule = None
+        # narrow typed columns instead of Person objects, see epidemic.compact
+        self.compact = compact
+        # "people.csv" or {"path": ..., "format": "csv" or "fixed_width", "fields": {...},
+        # "columns": {...}, "immunity": {...}}, replaces the random population
+        if isinstance(population_file, str):
+            population_file = {'path': population_file}
+        self.population_file = dict(population_file) if population_file is not None else None
+        self.imported = None
+        self.contact_radius = contact_radius
+        self.contact_decay = contact_decay
+        # every pathogen gets its own infection columns, so people can carry several at once
+        self.coinfection = coinfection
+        # {"window": 7, "levels": 3}, adds the infections per grid cell to the results
+        self.incidence = dict(incidence) if incidence is not None else None
+
+        if engine not in self.ENGINES:
+            raise ValueError('Unknown engine {}'.format(engine))
+        if len(self.grid) != 4:
+            raise ValueError('grid must be [min_j, max_j, min_i, max_i]')
+        for pathogen in self.pathogens:
+            if pathogen.get('type') not in InfectableType.__members__:
+                raise ValueError('Unknown pathogen type {}'.format(pathogen.get('type')))
+        if contact_radius < 0:
+            raise ValueError('contact_radius must not be negative')
+        if contact_radius > 0 and contact_decay is not None and not contact_decay > 0:
+            raise ValueError('contact_decay must be positive')
+        if self.sample is not None:
+            if engine != 'agents' or households or contact_radius or event_log or contact_graph:
+                raise ValueError('sample needs the agents engine without households, a contact radius, '
+                                 'an event log or a contact graph')
+            if 'fraction' not in self.sample:
+                raise ValueError('sample needs a fraction')
+            unknown = set(self.sample) - {'fraction', 'replicates', 'confidence', 'age_bins', 'weight_bins', 'regions'}
+            if unknown:
+                raise ValueError('Unknown sample keys: {}'.format(', '.join(sorted(unknown))))
+        if self.mobility is not None:
+            if engine != 'agents' or self.sample is not None:
+                raise ValueError('mobility needs the agents engine without sample')
+            unknown = set(self.mobility) - {'plans', 'pattern', 'seed', 'cache'}
+            if unknown:
+                raise ValueError('Unknown mobility keys: {}'.format(', '.join(sorted(unknown))))
+        if self.population_file is not None:
+            if self.sample is not None:
+                raise ValueError('population_file cannot be sampled')
+            if self.population_file.get('format', 'csv') not in ('csv', 'fixed_width'):
+                raise ValueError('Unknown population_file format {}'.format(self.population_file['format']))
+        if self.incidence is not None:
+            if engine != 'agents' or self.sample is not None:
+                raise ValueError('incidence needs the agents engine without sample')
+            unknown = set(self.incidence) - {'window', 'levels'}
+            if unknown:
+                raise ValueError('Unknown incidence keys: {}'.format(', '.join(sorted(unknown))))
+        if engine == 'metapopulation':
+            extras = [key for key in ('closed_form', 'event_log', 'contact_graph', 'households', 'mobility',
+                                      'compact', 'population_file', 'contact_radius', 'incidence')
+                      if getattr(self, key)]
+            if extras:
+                raise ValueError('The metapopulation engine does not support {}'.format(', '.join(extras)))
+        if coinfection and not compact:
+            raise ValueError('coinfection needs compact storage')
+        if compact:
+            extras = [key for key in ('sample', 'mobility', 'event_log', 'contact_graph', 'contact_radius')
+                      if getattr(self, key)]
+            if engine != 'agents' or households or closed_form or extras:
+                raise ValueError('compact runs the plain agents engine only')
+
+    @classmethod
+    def from_dict(cls, config):
+        unknown = set(config) - set(cls.KEYS)
+        if unknown:
+            raise ValueError('Unknown scenario keys: {}'.format(', '.join(sorted(unknown))))
+        config = dict(config)
+        if 'seed' in config:
+            if 'seeds' in config:
+                raise ValueError('Use either seed or seeds')
+            config['seeds'] = [config.pop('seed')]
+        return cls(**config)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def initial_infections(self, n_persons, fraction=1.0):
+        for pathogen in self.pathogens:
+            infectable_type = InfectableType[pathogen['type']]
+            infected = pathogen.get('infected', 1)
+            if fraction < 1.0:
+                # a sample keeps at least one of the initial cases
+                infected = max(1, round(infected * fraction))
+            for index in random.sample(range(n_persons), infected):
+                virus = get_infectable(infectable_type)
+                if 'strength' in pathogen:
+                    virus.strength = pathogen['strength']
+                if 'contag' in pathogen:
+                    virus.contag = pathogen['contag']
+                yield index, virus
+
+    def imported_population(self):
+        # read once, every seed starts from a fresh copy
+        if self.imported is None:
+            from . import census
+
+            options = dict(self.population_file)
+            path = options.pop('path')
+            if options.pop('format', 'csv') == 'csv':
+                self.imported = census.read_csv(path, **options)
+            else:
+                self.imported = census.read_fixed_width(path, **options)
+        return self.imported
+
+    def population_size(self):
+        if self.population_file is not None:
+            return len(self.imported_population())
+        return self.population
+
+    def create_population(self, persons=None, fraction=1.0):
+        if persons is None and self.population_file is not None:
+            persons = self.imported_population().to_persons()
+        elif persons is None:
+            persons = create_persons(*self.grid, self.population)
+        for index, virus in self.initial_infections(len(persons), fraction):
+            persons[index].get_infected(virus)
+        return persons
+
+    def incidence_map(self):
+        if self.incidence is None:
+            return None
+        from .incidence import IncidenceMap
+
+        return IncidenceMap(self.grid, **self.incidence)
+
+    def run_compact(self, seed):
+        from .compact import CompactPopulation, CompactSimulation
+
+        previous = state.set_grid(*self.grid)
+        try:
+            if seed is not None:
+                random.seed(seed)
+            if self.population_file is not None:
+                population = self.imported_population().copy()
+            else:
+                population = CompactPopulation.create(*self.grid, self.population)
+            incidence = self.incidence_map()
+            if self.coinfection:
+                from .coinfection import CoinfectionSimulation
+
+                pathogens = sorted({InfectableType[pathogen['type']] for pathogen in self.pathogens},
+                                   key=lambda t: t.value)
+                simulation = CoinfectionSimulation(population, pathogens, days=self.days, incidence=incidence)
+                infect = simulation.get_infected
+            else:
+                simulation = CompactSimulation(population, days=self.days, incidence=incidence)
+                infect = population.get_infected
+            for index, virus in self.initial_infections(len(population)):
+                infect(index, virus)
+            simulation.run()
+            results = {
+                'seed': seed,
+                'history': simulation.history,
+                'stop_reason': simulation.stop_reason,
+                'stop_day': simulation.stop_day,
+            }
+            if self.coinfection:
+                results['pathogens'] = simulation.pathogen_history
+            if incidence is not None:
+                results['incidence'] = incidence.export()
+            return results
+        finally:
+            state.set_grid(*previous)
+
+    def mobility_schedule(self):
+        # built once and shared by all the seeds of the ensemble
+        if self.schedule is None:
+            from .mobility import MobilitySchedule
+
+            options = self.mobility
+            args = (self.grid, self.population_size(), options.get('plans', 1), options.get('seed', 0),
+                    options.get('pattern'))
+            if 'cache' in options:
+                os.makedirs(options['cache'], exist_ok=True)
+                self.schedule = MobilitySchedule.cached(options['cache'], *args)
+            else:
+                self.schedule = MobilitySchedule.build(*args)
+        return self.schedule
+
+    def run_seed(self, seed):
+        previous = state.set_grid(*self.grid)
+        try:
+            if seed is not None:
+                random.seed(seed)
+            persons = self.create_population()
+
+            writers = []
+            kwargs = {}
+            if self.event_log is not None:
+                from .event_log import EventLogWriter
+                writers.append(EventLogWriter(self.event_log.format(seed=seed), len(persons), seed=seed))
+                kwargs['observers'] = [writers[-1]]
+            if self.contact_graph is not None:
+                from .contact_graph import ContactGraphWriter
+                writers.append(ContactGraphWriter(self.contact_graph.format(seed=seed), len(persons)))
+                kwargs['contact_graph'] = writers[-1]
+            incidence = self.incidence_map()
+            simulation_class = Simulation
+            if self.mobility is not None:
+                from .mobility import ScheduledSimulation
+                simulation_class = ScheduledSimulation
+                kwargs['mobility'] = self.mobility_schedule()
+            try:
+                simulation = simulation_class(persons, days=self.days, closed_form=self.closed_form,
+                                              households=self.households, contact_radius=self.contact_radius,
+                                              contact_decay=self.contact_decay, incidence=incidence, **kwargs)
+                simulation.run()
+            finally:
+                for writer in writers:
+                    writer.close()
+            results = {
+                'seed': seed,
+                'history': simulation.history,
+                'stop_reason': simulation.stop_reason,
+                'stop_day': simulation.stop_day,
+            }
+            if incidence is not None:
+                results['incidence'] = incidence.export()
+            return results
+        finally:
+            state.set_grid(*previous)
+
+    def run_sampled(self, seed):
+        from .sampling import StratifiedSample, SampledSimulation, confidence_band
+
+        options = dict(self.sample)
+        replicates = options.pop('replicates', 5)
+        confidence = options.pop('confidence', 0.95)
+        sample = StratifiedSample(self.grid, self.population, **options)
+        previous = state.set_grid(*sample.contact_grid)
+        try:
+            if seed is not None:
+                random.seed(seed)
+
+            histories = []
+            for _ in range(replicates):
+                persons, weights = sample.draw()
+                self.create_population(persons, sample.fraction)
+                # steady stops leave the sick unfinished and the history short, the band needs all the days
+                simulation = SampledSimulation(persons, weights, days=self.days, closed_form=self.closed_form,
+                                               steady_days=0)
+                histories.append(simulation.run())
+            mean, lower, upper = confidence_band(histories, confidence)
+            return {
+                'seed': seed,
+                'history': mean,
+                'lower': lower,
+                'upper': upper,
+                'confidence': confidence,
+                'replicates': histories,
+                'sample_size': sample.n_sample,
+                'density_ratio': sample.density_ratio,
+            }
+        finally:
+            state.set_grid(*previous)
+
+    def run_metapopulation(self, seed):
+        from .metapopulation import Metapopulation
+
+        if seed is not None:
+            random.seed(seed)
+        # the aggregated cells draw no per-person strength, a fixed one applies to the whole run
+        strengths = {InfectableType[pathogen['type']]: pathogen['strength']
+                     for pathogen in self.pathogens if 'strength' in pathogen}
+        metapopulation = Metapopulation(self.grid, agent_threshold=self.agent_threshold, strengths=strengths)
+        metapopulation.populate(self.population)
+        for pathogen in self.pathogens:
+            metapopulation.infect_random(InfectableType[pathogen['type']], pathogen.get('infected', 1))
+        metapopulation.run(self.days)
+        return {
+            'seed': seed,
+            'history': metapopulation.history,
+            'stop_reason': StopReason.COMPLETED,
+            'stop_day': self.days,
+        }
+
+    def run(self):
+        run_seed = self.run_seed
+        if self.engine == 'metapopulation':
+            run_seed = self.run_metapopulation
+        elif self.sample is not None:
+            run_seed = self.run_sampled
+        elif self.compact:
+            run_seed = self.run_compact
+        return {'runs': [run_seed(seed) for seed in self.seeds]}
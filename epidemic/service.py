@@ -0,0 +1,280 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from .scenario import Scenario
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+# scenario keys naming files on the server, which submitters must not read or write
+PATH_KEYS = ('event_log', 'contact_graph', 'population_file')
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict'}
+
+
+def config_key(config):
+    # identical configs, whatever their key order, share one job
+    canonical = json.dumps(config, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+
+def run_scenario(config):
+    return Scenario.from_dict(config).run()
+
+
+class ResultStore:
+    # results by job id, kept as JSON files when a directory is given
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.results = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def __contains__(self, key):
+        return key in self.results or (self.directory is not None and os.path.exists(self.path(key)))
+
+    def get(self, key):
+        if key not in self.results and self.directory is not None and os.path.exists(self.path(key)):
+            with open(self.path(key)) as f:
+                self.results[key] = json.load(f)
+        return self.results.get(key)
+
+    def put(self, key, results):
+        self.results[key] = results
+        if self.directory is not None:
+            partial = self.path(key) + '.tmp'
+            with open(partial, 'w') as f:
+                json.dump(results, f)
+            os.replace(partial, self.path(key))
+
+
+class Job:
+    def __init__(self, key, config, priority, status=QUEUED):
+        self.id = key
+        self.config = config
+        self.priority = priority
+        self.status = status
+        self.error = None
+        self.finished = asyncio.Event()
+        if status == DONE:
+            self.finished.set()
+
+    def describe(self):
+        description = {'id': self.id, 'status': self.status, 'priority': self.priority}
+        if self.error is not None:
+            description['error'] = self.error
+        return description
+
+
+class JobService:
+    # scenarios queued by priority (higher first) and run on a pool of at most `workers` processes
+    def __init__(self, workers=None, store=None, executor=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.store = store if store is not None else ResultStore()
+        self.executor = executor
+        self.jobs = {}
+        self.queue = asyncio.PriorityQueue()
+        self.order = itertools.count()
+        # job ids in the order they were started
+        self.started = []
+        self.tasks = []
+        self.server = None
+
+    def submit(self, config, priority=0):
+        if not isinstance(config, dict):
+            raise ValueError('scenario must be a JSON object')
+        paths = [name for name in PATH_KEYS if config.get(name)]
+        if paths:
+            raise ValueError('Server files cannot be used: {}'.format(', '.join(paths)))
+        # results go to the store, not to files of the submitter's choosing, and schedules are not cached
+        config = {name: value for name, value in config.items() if name != 'output'}
+        if isinstance(config.get('mobility'), dict):
+            config['mobility'] = {name: value for name, value in config['mobility'].items() if name != 'cache'}
+        Scenario.from_dict(config)
+        key = config_key(config)
+
+        job = self.jobs.get(key)
+        if job is None:
+            if key in self.store:
+                job = self.jobs[key] = Job(key, config, priority, DONE)
+                return job, False
+            job = self.jobs[key] = Job(key, config, priority)
+            self.queue.put_nowait((-priority, next(self.order), key))
+            return job, True
+        if job.status == FAILED:
+            # a failed job runs again when it is submitted again
+            job.status, job.error, job.priority = QUEUED, None, priority
+            job.finished.clear()
+            self.queue.put_nowait((-priority, next(self.order), key))
+            return job, True
+        if job.status == QUEUED and priority > job.priority:
+            # the old queue entry is skipped once it comes up
+            job.priority = priority
+            self.queue.put_nowait((-priority, next(self.order), key))
+        return job, False
+
+    def status(self, key):
+        job = self.jobs.get(key)
+        return job.describe() if job is not None else None
+
+    def result(self, key):
+        return self.store.get(key)
+
+    async def wait(self, key):
+        await self.jobs[key].finished.wait()
+        return self.jobs[key].describe()
+
+    async def worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            priority, _, key = await self.queue.get()
+            job = self.jobs[key]
+            if job.status != QUEUED or -priority != job.priority:
+                continue
+            job.status = RUNNING
+            self.started.append(key)
+            executor = self.executor
+            try:
+                results = await loop.run_in_executor(executor, run_scenario, job.config)
+            except BrokenProcessPool as e:
+                # a crashed process takes the pool down with it, the jobs after it get a new one
+                if executor is self.executor:
+                    self.executor = self.new_executor()
+                    executor.shutdown(wait=False)
+                job.status, job.error = FAILED, '{}: {}'.format(type(e).__name__, e)
+            except Exception as e:
+                job.status, job.error = FAILED, '{}: {}'.format(type(e).__name__, e)
+            else:
+                self.store.put(key, results)
+                job.status = DONE
+            job.finished.set()
+
+    def new_executor(self):
+        # forked workers would inherit the open client connections and keep them from closing
+        context = multiprocessing.get_context('forkserver')
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    async def start(self, host='127.0.0.1', port=0):
+        if self.executor is None:
+            self.executor = self.new_executor()
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def route(self, method, path, body):
+        parts = [part for part in path.split('/') if part]
+        if parts == ['jobs'] and method == 'POST':
+            try:
+                request = json.loads(body or b'{}')
+                job, created = self.submit(request.get('scenario'), int(request.get('priority', 0)))
+            except (ValueError, TypeError, AttributeError, OverflowError) as e:
+                # OverflowError is int() of an infinite priority such as 1e999
+                return 400, {'error': str(e)}
+            return (202 if created else 200), job.describe()
+        if method != 'GET':
+            return 405, {'error': 'Method not allowed'}
+        if parts == ['jobs']:
+            return 200, [job.describe() for job in self.jobs.values()]
+        if len(parts) in (2, 3) and parts[0] == 'jobs' and parts[1] in self.jobs:
+            job = self.jobs[parts[1]]
+            if len(parts) == 2:
+                return 200, job.describe()
+            if parts[2] == 'result':
+                if job.status != DONE:
+                    return 409, job.describe()
+                return 200, self.result(job.id)
+        return 404, {'error': 'Not found'}
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, _ = (await reader.readline()).decode().split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode().partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            status, payload = self.route(method, path, body)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, payload = 400, {'error': 'Malformed request'}
+        data = json.dumps(payload).encode()
+        writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                     'Connection: close\r\n\r\n'.format(status, REASONS[status], len(data)).encode() + data)
+        await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+
+async def request(host, port, method, path, payload=None):
+    # a minimal client, enough for scripts and tests
+    reader, writer = await asyncio.open_connection(host, port)
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write('{} {} HTTP/1.1\r\nHost: {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                 'Connection: close\r\n\r\n'.format(method, path, host, len(body)).encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = None
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode().partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    data = await (reader.readexactly(length) if length is not None else reader.read())
+    writer.close()
+    await writer.wait_closed()
+    return status, json.loads(data)
+
+
+async def serve(host, port, workers, store):
+    service = JobService(workers, ResultStore(store))
+    port = await service.start(host, port)
+    print('Serving scenario jobs on http://{}:{}/jobs'.format(host, port), flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m epidemic.service', description='Run the scenario job service.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None, help='processes running scenarios, CPU count by default')
+    parser.add_argument('--store', help='directory keeping the results between restarts')
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.host, args.port, args.workers, args.store))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+import gc
+import os
+import pickle
+import random
+from collections import defaultdict
+from .state import Healthy, AsymptomaticSick, SymptomaticSick, DepartmentOfHealth
+from .timeline import TimelineSchedule
+from .event_log import EventType
+from .household import HouseholdIndex
+from .proximity import radius_transmit
+
+STATE_NAMES = ('Healthy', 'AsymptomaticSick', 'SymptomaticSick', 'Dead')
+SICK_STATES = (AsymptomaticSick, SymptomaticSick)
+
+
+def state_name(state):
+    for cls in type(state).__mro__:
+        if cls.__name__ in STATE_NAMES:
+            return cls.__name__
+    raise ValueError()
+
+
+TRANSITIONS = {
+    ('Healthy', 'AsymptomaticSick'): (EventType.Infection,),
+    ('Healthy', 'SymptomaticSick'): (EventType.Infection, EventType.SymptomOnset),
+    ('AsymptomaticSick', 'SymptomaticSick'): (EventType.SymptomOnset,),
+    ('SymptomaticSick', 'Healthy'): (EventType.Recovery,),
+    ('Healthy', 'Dead'): (EventType.Death,),
+    ('AsymptomaticSick', 'Dead'): (EventType.Death,),
+    ('SymptomaticSick', 'Dead'): (EventType.Death,),
+}
+
+
+def count_states(persons):
+    counts = dict.fromkeys(STATE_NAMES, 0)
+    for person in persons:
+        counts[state_name(person.state)] += 1
+    return counts
+
+
+class StopReason:
+    COMPLETED = 'completed'
+    ABSORBING = 'absorbing'
+    STEADY = 'steady'
+
+
+class Simulation:
+    STEADY_STATE_DAYS = 10
+    STEADY_STATE_TOLERANCE = 0
+
+    def __init__(self, persons, days=100, early_stop=True, fill_remaining=True,
+                 steady_days=STEADY_STATE_DAYS, tolerance=STEADY_STATE_TOLERANCE,
+                 closed_form=False, contact_graph=None, seed=None, observers=(), households=False,
+                 contact_radius=0, contact_decay=None, incidence=None):
+        self.persons = persons
+        self.days = days
+        self.early_stop = early_stop
+        self.fill_remaining = fill_remaining
+        self.steady_days = steady_days
+        self.tolerance = tolerance
+        self.day = 0
+        self.history = []
+        self.stop_reason = None
+        self.stop_day = None
+        # disease outcomes are computed at infection time instead of day by day
+        self.schedule = TimelineSchedule() if closed_form else None
+        # ContactGraphWriter recording the co-location contacts of every day
+        self.contact_graph = contact_graph
+        self.seed = seed
+        if seed is not None:
+            random.seed(seed)
+        # observers get notify(day, index, event_type, infectable_type) for every transition
+        self.observers = list(observers)
+        self.indices = {id(person): index for index, person in enumerate(persons)}
+        self.snapshot = None
+        self.hospitalized = set()
+        # people sharing a home_position also meet at night
+        self.households = HouseholdIndex(persons) if households else None
+        # people closer than contact_radius meet, transmission decays as exp(-distance / contact_decay)
+        self.contact_radius = contact_radius
+        self.contact_decay = contact_decay if contact_decay is not None else contact_radius
+        if contact_radius < 0:
+            raise ValueError('contact_radius must not be negative')
+        if contact_radius > 0 and not self.contact_decay > 0:
+            raise ValueError('contact_decay must be positive')
+        if contact_radius > 0 and contact_graph is not None:
+            raise ValueError('Contact graphs record exact-cell contacts only')
+        # IncidenceMap counting where the infections of every day happen
+        self.incidence = incidence
+
+    def apply_schedule(self, phase):
+        if self.schedule is not None:
+            self.schedule.apply(self.day, phase)
+
+    def on_infected(self, infected, day=None):
+        if self.incidence is not None:
+            self.incidence.record(person.position for person in infected)
+        if self.households is not None:
+            for person in infected:
+                self.households.add(self.indices[id(person)])
+        if self.schedule is not None:
+            for person in infected:
+                self.schedule.schedule(person, self.day if day is None else day)
+
+    @staticmethod
+    def symptoms_phase(ill):
+        # one symptom kernel call per pathogen over all the ill instead of one call per person,
+        # then the rest of their day in their order
+        by_pathogen = defaultdict(list)
+        for person in ill:
+            if person.virus is not None:
+                by_pathogen[type(person.virus)].append(person)
+        for virus_class, group in by_pathogen.items():
+            virus_class.cause_symptoms_persons(group)
+        for person in ill:
+            person.state.check_condition()
+
+    def day_phase(self):
+        ill = []
+        for person in self.persons:
+            if person.state.SHOWS_SYMPTOMS:
+                ill.append(person)
+            else:
+                person.day_actions()
+        self.symptoms_phase(ill)
+        self.apply_schedule(TimelineSchedule.DAY)
+        self.apply_policies()
+
+    def apply_policies(self):
+        health_dept = DepartmentOfHealth()
+        if health_dept.policies:
+            health_dept.monitor_situation(self.persons, self.day)
+
+    def colocated_groups(self):
+        by_position = defaultdict(list)
+        for index, person in enumerate(self.persons):
+            by_position[person.position].append(index)
+        return [group for group in by_position.values() if len(group) > 1]
+
+    @staticmethod
+    def transmit(group, infected):
+        # only those sick before the contacts can spread the virus
+        sick = [person for person in group if isinstance(person.state, SICK_STATES)]
+        if not sick:
+            return
+        # the first sick person carrying a pathogen someone has no antibodies for infects them,
+        # so each of them is matched against the few pathogens instead of every sick person
+        carriers = {}
+        for index, person in enumerate(sick):
+            carriers.setdefault(person.virus.get_type(), index)
+        carriers = sorted(carriers.items(), key=lambda carrier: carrier[1])
+        contacts = []
+        for position, other in enumerate(group):
+            if not isinstance(other.state, Healthy):
+                continue
+            for infectable_type, index in carriers:
+                if infectable_type not in other.antibody_types:
+                    contacts.append((index, position, other))
+                    break
+        contacts.sort(key=lambda contact: contact[:2])
+        for index, _, other in contacts:
+            before = other.state
+            sick[index].interact(other)
+            if other.state is not before:
+                infected.append(other)
+
+    def radius_contact_phase(self):
+        infected = []
+        sick = [index for index, person in enumerate(self.persons) if isinstance(person.state, SICK_STATES)]
+        if sick:
+            radius_transmit(self.persons, sick, self.contact_radius, self.contact_decay, infected)
+        self.on_infected(infected)
+        return infected
+
+    def contact_phase(self):
+        if self.contact_radius > 0:
+            return self.radius_contact_phase()
+        infected = []
+        groups = self.colocated_groups()
+        if self.contact_graph is not None:
+            self.contact_graph.record(self.day, groups)
+
+        for group in groups:
+            self.transmit([self.persons[index] for index in group], infected)
+
+        self.on_infected(infected)
+        return infected
+
+    def household_phase(self):
+        infected = []
+        self.households.update()
+        for members in self.households.infected_households():
+            self.transmit([self.persons[index] for index in members], infected)
+        # the night of this day is already over for them, so they start sick tomorrow
+        self.on_infected(infected, self.day + 1)
+        return infected
+
+    def night_phase(self):
+        for person in self.persons:
+            person.night_actions()
+        self.apply_schedule(TimelineSchedule.NIGHT)
+        if self.households is not None:
+            self.household_phase()
+
+    def notify(self, index, event_type, infectable_type):
+        for observer in self.observers:
+            observer.notify(self.day, index, event_type, infectable_type)
+
+    def on_hospitalized(self, person):
+        index = self.indices.get(id(person))
+        if index is not None and index not in self.hospitalized:
+            self.hospitalized.add(index)
+            self.notify(index, EventType.Hospitalization, person.virus.get_type())
+
+    def report_transitions(self):
+        if self.snapshot is None:
+            # everyone starts from Healthy as far as the observers know
+            self.snapshot = [('Healthy', None)] * len(self.persons)
+        for index, person in enumerate(self.persons):
+            before, virus = self.snapshot[index]
+            after = state_name(person.state)
+            if after == before:
+                continue
+            virus = person.virus or virus
+            infectable_type = virus.get_type() if virus is not None else None
+            for event_type in TRANSITIONS.get((before, after), ()):
+                self.notify(index, event_type, infectable_type)
+            if after in ('Healthy', 'Dead'):
+                self.hospitalized.discard(index)
+            self.snapshot[index] = (after, person.virus)
+
+    def run_phases(self):
+        self.day_phase()
+        self.contact_phase()
+        self.night_phase()
+
+    def run_observed_phases(self):
+        health_dept = DepartmentOfHealth()
+        health_dept.listeners.append(self.on_hospitalized)
+        try:
+            if self.snapshot is None:
+                self.report_transitions()
+            self.day_phase()
+            self.report_transitions()
+            self.contact_phase()
+            self.report_transitions()
+            self.night_phase()
+            self.report_transitions()
+        finally:
+            health_dept.listeners.remove(self.on_hospitalized)
+
+    def counts(self):
+        return count_states(self.persons)
+
+    def step(self):
+        if self.observers:
+            self.run_observed_phases()
+        else:
+            self.run_phases()
+        if self.incidence is not None:
+            self.incidence.end_day()
+        self.history.append(self.counts())
+        self.day += 1
+
+    def is_absorbing(self):
+        counts = self.history[-1]
+        return counts['AsymptomaticSick'] == 0 and counts['SymptomaticSick'] == 0
+
+    def is_steady(self):
+        if self.steady_days <= 0 or len(self.history) <= self.steady_days:
+            return False
+        last = self.history[-1]
+        for counts in self.history[-self.steady_days - 1:-1]:
+            for name in STATE_NAMES:
+                if abs(counts[name] - last[name]) > self.tolerance:
+                    return False
+        return True
+
+    def has_pending_transitions(self):
+        # the sick still move on to death or recovery, even while the counts stand still
+        if self.schedule is not None and self.schedule.events:
+            return True
+        return not self.is_absorbing()
+
+    def check_stop(self):
+        if self.is_absorbing():
+            return StopReason.ABSORBING
+        if self.is_steady():
+            return StopReason.STEADY
+        return None
+
+    def results(self):
+        return {'history': self.history, 'stop_reason': self.stop_reason, 'stop_day': self.stop_day}
+
+    def _run_branch(self, setup, write_fd, rng_state):
+        # whatever fails, the child ends here and never returns into the parent's fork loop
+        status = 1
+        try:
+            try:
+                # the random module reseeds itself in forked children
+                random.setstate(rng_state)
+                # files and sockets of the parent run must not be shared with the branches
+                self.contact_graph = None
+                self.observers = []
+                setup(self)
+                self.run()
+                payload = self.results()
+            except BaseException as e:
+                payload = {'error': repr(e)}
+            with os.fdopen(write_fd, 'wb') as f:
+                pickle.dump(payload, f)
+            status = 0
+        finally:
+            os._exit(status)
+
+    def fork(self, branches):
+        # branches maps a name to setup(simulation), e.g. issuing policies; each branch continues
+        # from the current day (people, viruses, RNG state and policies) in a forked child that
+        # shares the parent's memory copy-on-write
+        children = {}
+        results, failures = {}, []
+        rng_state = random.getstate()
+        gc.freeze()
+        try:
+            for name, setup in branches.items():
+                read_fd, write_fd = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(read_fd)
+                    self._run_branch(setup, write_fd, rng_state)
+                os.close(write_fd)
+                children[name] = (pid, read_fd)
+        finally:
+            gc.unfreeze()
+            # every child started is read and reaped, even after a failed fork or branch
+            for name, (pid, read_fd) in children.items():
+                with os.fdopen(read_fd, 'rb') as f:
+                    data = f.read()
+                _, status = os.waitpid(pid, 0)
+                try:
+                    result = pickle.loads(data)
+                except Exception:
+                    result = {'error': 'branch exited without results, status {}'.format(status)}
+                if 'error' in result:
+                    failures.append('Branch {} failed: {}'.format(name, result['error']))
+                else:
+                    results[name] = result
+        if failures:
+            raise RuntimeError('; '.join(failures))
+        return results
+
+    def run(self):
+        while self.day < self.days:
+            self.step()
+            reason = self.check_stop() if self.early_stop else None
+            if reason is not None and self.day < self.days:
+                self.stop_reason = reason
+                self.stop_day = self.day
+                if self.fill_remaining and not self.has_pending_transitions():
+                    # nothing observable changes any more, repeat the last counts
+                    last = self.history[-1]
+                    self.history.extend(dict(last) for _ in range(self.days - self.day))
+                return self.history
+
+        self.stop_reason = StopReason.COMPLETED
+        self.stop_day = self.day
+        return self.history
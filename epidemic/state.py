@@ -1,12 +1,23 @@
 from abc import ABC, abstractmethod
-from random import randint
+from copy import copy
+from random import randint, random
 # from __future__ import annotations
 
 min_i, max_i = 0, 100
 min_j, max_j = 0, 100
+
+
+def set_grid(new_min_j, new_max_j, new_min_i, new_max_i):
+    global min_j, max_j, min_i, max_i
+    previous = (min_j, max_j, min_i, max_i)
+    min_j, max_j, min_i, max_i = new_min_j, new_max_j, new_min_i, new_max_i
+    return previous
     
 
 class State(ABC):
+    # people in states with symptoms get them from the pathogen's kernel every day
+    SHOWS_SYMPTOMS = False
+
     def __init__(self, person): 
         self.person = person
         
@@ -36,7 +47,8 @@ class Healthy(State):
 
     def get_infected(self, virus):
         if virus.get_type() not in self.person.antibody_types:
-            self.person.virus = virus
+            # every infection fights its own copy of the virus
+            self.person.virus = copy(virus)
             self.person.set_state(AsymptomaticSick(self.person))
 
 
@@ -61,27 +73,71 @@ class AsymptomaticSick(State):
     def interact(self, other):
         other.get_infected(self.person.virus)
 
-    def get_infected(self, virus): 
-        other.get_infected(self.person.virus)
+    def get_infected(self, virus): pass
+
+
+class Policy(ABC):
+    def __init__(self, start_day=0, end_day=None):
+        self.start_day = start_day
+        self.end_day = end_day
+
+    def is_active(self, day):
+        return self.start_day <= day and (self.end_day is None or day < self.end_day)
+
+    @abstractmethod
+    def apply(self, person): pass
+
+
+class Lockdown(Policy):
+    # sends a share of the people out and about back home for the day
+    def __init__(self, compliance=1.0, **kwargs):
+        super().__init__(**kwargs)
+        self.compliance = compliance
+
+    def apply(self, person):
+        if isinstance(person.state, (Healthy, AsymptomaticSick)):
+            if self.compliance >= 1.0 or random() < self.compliance:
+                person.position = person.home_position
+
 
-        
 class DepartmentOfHealth:
+    __instance = None
+
+    def __new__(cls, *args):
+        if cls.__instance is None:
+            cls.__instance = object.__new__(cls, *args)
+            cls.__instance.listeners = []
+            cls.__instance.policies = []
+        return cls.__instance
+
     def __init__(self):
         pass
     
-    def monitor_situation(self):
-        pass
+    def monitor_situation(self, persons, day):
+        for policy in self.policies:
+            if policy.is_active(day):
+                for person in persons:
+                    policy.apply(person)
     
-    def issue_policy(self):
-        pass
+    def issue_policy(self, policy):
+        self.policies.append(policy)
+
+    def withdraw_policies(self):
+        self.policies.clear()
     
     def hospitalize(self, person):
-        pass
+        for listener in self.listeners:
+            listener(person)
 
 class SymptomaticSick(State):
+    SHOWS_SYMPTOMS = True
+
     def day_actions(self):
         self.person.progress_disease()
-        
+        self.check_condition()
+
+    def check_condition(self):
+        # the rest of the day once the symptoms are there
         if self.person.is_life_threatening_condition():
             health_dept = DepartmentOfHealth()
             health_dept.hospitalize(self.person)
@@ -0,0 +1,150 @@
+from math import ceil
+from .person import Person
+from .state import AsymptomaticSick, SymptomaticSick, Healthy, Dead, DepartmentOfHealth
+
+_TIE = 1e-9
+
+
+class Outcome:
+    RECOVERED = 'recovered'
+    DEAD = 'dead'
+
+
+class Timeline:
+    # days are counted from the day of infection
+    def __init__(self, onset, hospitalization, outcome, outcome_day, temperature, water, strength):
+        self.onset = onset
+        self.hospitalization = hospitalization
+        self.outcome = outcome
+        self.outcome_day = outcome_day
+        self.temperature = temperature
+        self.water = water
+        self.strength = strength
+
+
+def _first_day(value, delta, limit, reached):
+    # smallest k >= 1 such that reached(value + k * delta), None if never
+    if delta == 0:
+        return 1 if reached(value) else None
+    k = max(1, ceil((limit - value) / delta))
+    if abs(value + k * delta - limit) < _TIE or abs(value + (k - 1) * delta - limit) < _TIE:
+        # on a tie the rounding of the daily updates decides, so replay them
+        k = 0
+        while True:
+            k += 1
+            value += delta
+            if reached(value):
+                return k
+    while not reached(value + k * delta):
+        k += 1
+    while k > 1 and reached(value + (k - 1) * delta):
+        k -= 1
+    return k
+
+
+def _earliest(*days):
+    days = [day for day in days if day is not None]
+    return min(days) if days else None
+
+
+def plan_infection(person):
+    virus = person.virus
+    temperature, water, weight = person.temperature, person.water, person.weight
+    d_temperature, d_water = virus.symptoms_per_day()
+
+    def symptoms_day(temperature_limit, water_pct):
+        return _earliest(
+            _first_day(temperature, d_temperature, temperature_limit, lambda t: t >= temperature_limit),
+            _first_day(water, -d_water, water_pct * weight, lambda w: w / weight <= water_pct),
+        )
+
+    threatening = symptoms_day(Person.LIFE_THREATENING_TEMPERATURE, Person.LIFE_THREATENING_WATER_PCT)
+    incompatible = symptoms_day(Person.MAX_TEMPERATURE_TO_SURVIVE, Person.LOWEST_WATER_PCT_TO_SURVIVE)
+    recovery = _first_day(virus.strength, -virus.RECOVERY_PER_DAY / person.age, 0.0, lambda s: s <= 0)
+
+    if incompatible is not None and incompatible <= recovery:
+        outcome, last_day = Outcome.DEAD, incompatible
+    else:
+        outcome, last_day = Outcome.RECOVERED, recovery
+    if threatening is not None and threatening > last_day:
+        threatening = None
+
+    onset = AsymptomaticSick.DAYS_SICK_TO_FEEL_BAD
+    # fight_virus only runs on the nights the person survived
+    nights = last_day if outcome == Outcome.RECOVERED else last_day - 1
+    return Timeline(
+        onset=onset,
+        hospitalization=None if threatening is None else onset + threatening,
+        outcome=outcome,
+        outcome_day=onset + last_day,
+        temperature=temperature + last_day * d_temperature,
+        water=water - last_day * d_water,
+        strength=virus.strength - nights * virus.RECOVERY_PER_DAY / person.age,
+    )
+
+
+class PlannedAsymptomaticSick(AsymptomaticSick):
+    def night_actions(self):
+        self.person.position = self.person.home_position
+
+
+class PlannedSymptomaticSick(SymptomaticSick):
+    # the symptoms are part of the plan
+    SHOWS_SYMPTOMS = False
+
+    def day_actions(self): pass
+
+    def night_actions(self): pass
+
+
+class TimelineSchedule:
+    DAY = 'day'
+    NIGHT = 'night'
+
+    def __init__(self):
+        self.events = {}
+
+    def add(self, day, phase, action, *args):
+        self.events.setdefault((day, phase), []).append((action, args))
+
+    def apply(self, day, phase):
+        for action, args in self.events.pop((day, phase), ()):
+            action(*args)
+
+    def schedule(self, person, day):
+        timeline = plan_infection(person)
+        person.set_state(PlannedAsymptomaticSick(person))
+        self.add(day + timeline.onset, self.NIGHT, self.onset, person)
+        if timeline.hospitalization is not None:
+            self.add(day + timeline.hospitalization, self.DAY, self.hospitalize, person)
+        if timeline.outcome == Outcome.DEAD:
+            self.add(day + timeline.outcome_day, self.DAY, self.die, person, timeline)
+        else:
+            self.add(day + timeline.outcome_day, self.NIGHT, self.recover, person, timeline)
+        return timeline
+
+    @staticmethod
+    def onset(person):
+        person.set_state(PlannedSymptomaticSick(person))
+
+    @staticmethod
+    def hospitalize(person):
+        DepartmentOfHealth().hospitalize(person)
+
+    @staticmethod
+    def _update(person, timeline):
+        person.temperature = timeline.temperature
+        person.water = timeline.water
+        person.virus.strength = timeline.strength
+
+    @staticmethod
+    def die(person, timeline):
+        TimelineSchedule._update(person, timeline)
+        person.set_state(Dead(person))
+
+    @staticmethod
+    def recover(person, timeline):
+        TimelineSchedule._update(person, timeline)
+        person.set_state(Healthy(person))
+        person.antibody_types.add(person.virus.get_type())
+        person.virus = None
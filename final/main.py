@@ -1,320 +1,13 @@
 import unittest
 import random
+import os
+import sys
 
-from random import expovariate, uniform, randint
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-from abc import ABC, abstractmethod
-
-from enum import Enum
-
-class Infectable(ABC):
-    def __init__(self, strength=1.0, contag=1.0):
-        # contag is for contagiousness so we have less typos
-        self.strength = strength
-        self.contag = contag
-
-    @abstractmethod
-    def cause_symptoms(self, person):
-        pass
-    
-    
-class SeasonalFluVirus(Infectable):
-
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.name= 'SeasonalFluVirus'
-
-    def cause_symptoms(self, person):
-        person.temperature += 0.25
-
-    def get_type(self):
-        return InfectableType.SeasonalFlu
-
-   
-    
-class SARSCoV2(Infectable):
-
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.name= 'SARSCoV2'
-
-    def cause_symptoms(self, person):
-        person.temperature += 0.5
-
-    def get_type(self):
-        return InfectableType.SARSCoV2
-
-
-class Cholera(Infectable):
-
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.name= 'Cholera'
-
-    def cause_symptoms(self, person):
-        person.water -= 1.0
-
-    def get_type(self):
-        return InfectableType.Cholera
-    
-
-class InfectableType(Enum):
-    SeasonalFlu = 1
-    SARSCoV2 = 2
-    Cholera = 3
-
-    
-def get_infectable(infectable_type: InfectableType):
-    if InfectableType.SeasonalFlu == infectable_type:
-        return SeasonalFluVirus(strength=expovariate(10.0), contag=expovariate(10.0))
-    
-    elif InfectableType.SARSCoV2 == infectable_type:
-        return SARSCoV2(strength=expovariate(2.0), contag=expovariate(2.0))
-    
-    elif InfectableType.Cholera == infectable_type:
-        return Cholera(strength=expovariate(2.0), contag=expovariate(2.0))
-    
-    else:
-        raise ValueError()
-
-min_i, max_i = 0, 100
-min_j, max_j = 0, 100
-    
-
-class State(ABC):
-    def __init__(self, person): 
-        self.person = person
-        
-    @abstractmethod
-    def day_actions(self): pass
-
-    @abstractmethod
-    def night_actions(self): pass
-
-    @abstractmethod
-    def interact(self, other): pass
-
-    @abstractmethod
-    def get_infected(self, virus): pass
-
-
-class Healthy(State):
-    def day_actions(self):
-        # different for CommunityPerson?!
-        self.person.position = (randint(min_j, max_j), randint(min_i, max_i))
-
-    def night_actions(self):
-        self.person.position = self.person.home_position
-
-    # def interact(self, other: Person): pass
-    def interact(self, other): pass
-
-    def get_infected(self, virus):
-        if virus.get_type() not in self.person.antibody_types:
-            self.person.virus = virus
-            self.person.set_state(AsymptomaticSick(self.person))
-
-
-class AsymptomaticSick(State):
-    DAYS_SICK_TO_FEEL_BAD = 2
-    
-    def __init__(self, person):
-        super().__init__(person)
-        self.days_sick = 0
-
-    def day_actions(self):
-        # different for CommunityPerson?!
-        self.person.position = (randint(min_j, max_j), randint(min_i, max_i))
-
-    def night_actions(self):
-        self.person.position = self.person.home_position
-        if self.days_sick == AsymptomaticSick.DAYS_SICK_TO_FEEL_BAD:
-            self.person.set_state(SymptomaticSick(self.person))
-        self.days_sick += 1
-
-    # def interact(self, other: Person):
-    def interact(self, other):
-        other.get_infected(self.person.virus)
-
-    def get_infected(self, virus): 
-        other.get_infected(self.person.virus)
-
-        
-class DepartmentOfHealth:
-    def __init__(self):
-        pass
-    
-    def monitor_situation(self):
-        pass
-    
-    def issue_policy(self):
-        pass
-    
-    def hospitalize(self, person):
-        pass
-
-class SymptomaticSick(State):
-    def day_actions(self):
-        self.person.progress_disease()
-        
-        if self.person.is_life_threatening_condition():
-            health_dept = DepartmentOfHealth()
-            health_dept.hospitalize(self.person)
-
-        if self.person.is_life_incompatible_condition():
-            self.person.set_state(Dead(self.person))
-        
-    def night_actions(self):
-        # try to fight the virus
-
-        self.person.fight_virus()
-        if self.person.virus.strength <= 0:
-            self.person.set_state(Healthy(self.person))
-            self.person.antibody_types.add(self.person.virus.get_type())
-            self.person.virus = None
-
-    # def interact(self, other: Person):
-    def interact(self, other): 
-        other.get_infected(self.person.virus)
-
-
-    def get_infected(self, virus): pass
-
-class Dead(State):
-    def day_actions(self): pass
-
-    def night_actions(self): pass
-
-    def interact(self, other): pass
-
-    def get_infected(self, other): pass
-
-class Person(ABC):
-    MAX_TEMPERATURE_TO_SURVIVE = 44.0
-    LOWEST_WATER_PCT_TO_SURVIVE = 0.4
-    
-    LIFE_THREATENING_TEMPERATURE = 40.0
-    LIFE_THREATENING_WATER_PCT = 0.5
-    
-    def __init__(self, home_position=(0, 0), age=30, weight=70, virus=None, name=None):
-        self.name = name
-        self.age = age
-        self.weight = weight
-        self.temperature = 36.6
-        self.water = 0.6 * self.weight
-        self.virus = virus
-        self.antibody_types = set()
-        self.home_position = home_position
-        self.position = home_position
-        self.state = Healthy(self)
-    
-    @abstractmethod
-    def day_actions(self): pass
-
-    @abstractmethod
-    def night_actions(self): pass
-
-    @abstractmethod
-    def interact(self, other): pass
-
-    @abstractmethod
-    def get_infected(self, virus): pass
-    
-    def is_contacting(self, other):
-        return self.position == other.position
-    
-    @abstractmethod
-    def fight_virus(self): pass
-
-    @abstractmethod
-    def progress_disease(self): pass
-
-    @abstractmethod
-    def set_state(self, state): pass
-    
-    def is_life_threatening_condition(self):
-        return self.temperature >= Person.LIFE_THREATENING_TEMPERATURE or \
-           self.water / self.weight <= Person.LIFE_THREATENING_WATER_PCT
-    
-    def is_life_incompatible_condition(self):        
-        return self.temperature >= Person.MAX_TEMPERATURE_TO_SURVIVE or \
-            self.water / self.weight <= Person.LOWEST_WATER_PCT_TO_SURVIVE
-
-
-class DefaultPerson(Person):
-    
-    def day_actions(self):
-        self.state.day_actions()
-
-    def night_actions(self):
-        self.state.night_actions()
-
-    def interact(self, other):
-        self.state.interact(other)
-
-    def get_infected(self, virus):
-        self.state.get_infected(virus)
-    
-    def is_contacting(self, other):
-        return self.position == other.position
-    
-    def fight_virus(self):
-        if self.virus:
-            self.virus.strength -= (3.0 / self.age)
-        
-    def progress_disease(self):
-        if self.virus:
-            self.virus.cause_symptoms(self)
-
-    def set_state(self, state):
-        self.state = state
-
-class CommunityPerson(Person):
-
-    def __init__(self, community_position=(0, 0), **kwargs):
-        super().__init__(**kwargs)
-        self.community_position = community_position
-    
-    def day_actions(self):
-        self.state.day_actions()
-
-    def night_actions(self):
-        self.state.night_actions()
-
-    def interact(self, other):
-        self.state.interact(other)
-
-    def get_infected(self, virus):
-        self.state.get_infected(virus)
-    
-    def is_contacting(self, other):
-        return self.position == other.position
-    
-    def fight_virus(self):
-        if self.virus:
-            self.virus.strength -= (3.0 / self.age)
-        
-    def progress_disease(self):
-        if self.virus:
-            self.virus.cause_symptoms(self)
-
-    def set_state(self, state):
-
-        self.state = state
-
-
-def create_persons(min_j, max_j, min_i, max_i, n_persons):
-    min_age, max_age = 1, 90
-    min_weight, max_weight = 30, 120
-    persons = [
-        DefaultPerson(
-            home_position=(randint(min_j, max_j), randint(min_i, max_i)),
-            age=randint(min_age, max_age),
-            weight=randint(min_weight, max_weight),
-        )
-        for i in range(n_persons)
-    ]
-    return persons
+from epidemic.infectable import Cholera, SeasonalFluVirus, SARSCoV2
+from epidemic.state import Healthy, AsymptomaticSick, SymptomaticSick, Dead
+from epidemic.person import DefaultPerson, create_persons
 
 #Tasks 1-2 (compulsory)
 class TestVirusSpread(unittest.TestCase):
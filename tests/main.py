@@ -1,23 +1,46 @@
 import unittest
 import random
-from Person import DefaultPerson
-from Infectable import Cholera, SeasonalFluVirus, SARSCoV2
-from State import SymptomaticSick, AsymptomaticSick, Healthy, Dead
-
-from random import randint
-
-def create_persons(min_j, max_j, min_i, max_i, n_persons):
-    min_age, max_age = 1, 90
-    min_weight, max_weight = 30, 120
-    persons = [
-        DefaultPerson(
-            home_position=(randint(min_j, max_j), randint(min_i, max_i)),
-            age=randint(min_age, max_age),
-            weight=randint(min_weight, max_weight),
-        )
-        for i in range(n_persons)
-    ]
-    return persons
+import os
+import sys
+import json
+import subprocess
+import tempfile
+import asyncio
+import socket
+import threading
+import time
+from math import sqrt
+from statistics import fmean, stdev
+from collections import Counter
+from unittest.mock import ANY
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from epidemic.person import DefaultPerson, create_persons
+from epidemic.infectable import Cholera, SeasonalFluVirus, SARSCoV2, InfectableType, PATHOGENS, get_infectable, \
+    register_pathogen
+from epidemic.state import SymptomaticSick, AsymptomaticSick, Healthy, Dead, set_grid, DepartmentOfHealth, Lockdown
+from epidemic.simulation import Simulation, StopReason, STATE_NAMES
+from epidemic.timeline import plan_infection, Outcome
+from epidemic.event_log import EventLogWriter, EventLogReader, EventType
+from epidemic.distributed import TileGrid, TileCoordinator, TileWorker, send_message, virus_spec
+from epidemic.household import HouseholdIndex
+from epidemic.sampling import StratifiedSample, confidence_band, student_t_quantile
+from epidemic.mobility import MobilitySchedule, ScheduledSimulation
+from epidemic.compact import CompactPopulation, CompactSimulation, check_precision
+from epidemic.census import read_csv, read_fixed_width
+from epidemic.proximity import CellList, distance
+from epidemic.coinfection import CoinfectionSimulation
+from epidemic.incidence import IncidenceMap
+from epidemic.service import JobService, ResultStore, request
+from epidemic import benchmark
+from epidemic.scenario import Scenario
+from epidemic.metapopulation import Metapopulation, binomial, antibody_mask
+from epidemic.__main__ import main as run_cli
+from epidemic.contact_graph import ContactGraph, ContactGraphWriter, ContactGraphReader, ReplaySimulation
+
 
 #Tasks 1-2 (compulsory)
 class TestVirusSpread(unittest.TestCase):
@@ -252,6 +275,1202 @@ class TestAntibodyState(unittest.TestCase):
         antibody = self.person[0].antibody_types
         assert virus_type_prove in antibody, "No antibody to virus type {}".format(virus_type_prove)            
 
+#Steady-state detection
+class TestSimulationStop(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(0)
+        self.persons = create_persons(0, 100, 0, 100, 20)
+
+    def test_absorbing_state(self):
+        simulation = Simulation(self.persons, days=30)
+        history = simulation.run()
+
+        self.assertEqual(simulation.stop_reason, StopReason.ABSORBING)
+        self.assertEqual(simulation.stop_day, 1)
+        self.assertEqual(len(history), 30)
+        self.assertEqual(history[-1]['Healthy'], 20)
+
+    def test_steady_state(self):
+        sick = self.persons[0]
+        sick.age = 90
+        sick.virus = SeasonalFluVirus(strength=100.0)
+        sick.set_state(SymptomaticSick(sick))
+
+        simulation = Simulation(self.persons, days=30, steady_days=5)
+        history = simulation.run()
+
+        self.assertEqual(simulation.stop_reason, StopReason.STEADY)
+        self.assertEqual(simulation.stop_day, 6)
+        # the sick person is still on the way to death, so the remaining days are not made up
+        self.assertEqual(len(history), 6)
+        self.assertEqual(history[-1]['SymptomaticSick'], 1)
+
+    def test_no_early_stop(self):
+        simulation = Simulation(self.persons, days=5, early_stop=False)
+        history = simulation.run()
+
+        self.assertEqual(simulation.stop_reason, StopReason.COMPLETED)
+        self.assertEqual(simulation.day, 5)
+        self.assertEqual(len(history), 5)
+
+
+#Closed-form outcomes
+class TestClosedForm(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(1)
+
+    def _create_infected_person(self, virus):
+        person = create_persons(0, 100, 0, 100, 1)[0]
+        person.get_infected(virus)
+        return person
+
+    @staticmethod
+    def _simulate_outcome(person):
+        person.night_actions()
+        day = 0
+        while isinstance(person.state, (AsymptomaticSick, SymptomaticSick)):
+            day += 1
+            person.day_actions()
+            person.night_actions()
+        return day
+
+    def test_outcome_matches_stepwise(self):
+        for virus_class in (SeasonalFluVirus, SARSCoV2, Cholera):
+            for _ in range(50):
+                person = self._create_infected_person(virus_class(strength=random.uniform(0.0, 5.0)))
+                timeline = plan_infection(person)
+                day = self._simulate_outcome(person)
+
+                expected = Outcome.DEAD if isinstance(person.state, Dead) else Outcome.RECOVERED
+                self.assertEqual(timeline.outcome, expected)
+                self.assertEqual(timeline.outcome_day, day)
+                self.assertAlmostEqual(timeline.temperature, person.temperature)
+                self.assertAlmostEqual(timeline.water, person.water)
+
+    def test_simulation_matches_stepwise(self):
+        histories = []
+        grid = set_grid(0, 5, 0, 5)
+        self.addCleanup(set_grid, *grid)
+        for closed_form in (False, True):
+            random.seed(2)
+            persons = create_persons(0, 5, 0, 5, 100)
+            for person in persons[:5]:
+                person.get_infected(SARSCoV2(strength=2.0))
+            simulation = Simulation(persons, days=40, closed_form=closed_form)
+            histories.append(simulation.run())
+
+        self.assertEqual(histories[0], histories[1])
+
+
+#Contact graph capture and replay
+class TestContactGraph(unittest.TestCase):
+
+    def setUp(self):
+        grid = set_grid(0, 5, 0, 5)
+        self.addCleanup(set_grid, *grid)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'contacts.csr')
+
+    def _create_population(self, strength):
+        random.seed(3)
+        persons = create_persons(0, 5, 0, 5, 60)
+        for person in persons[:3]:
+            person.get_infected(SARSCoV2(strength=strength))
+        return persons
+
+    def test_csr_neighbors(self):
+        graph = ContactGraph.from_groups(0, 5, [[0, 2, 4], [1, 3]])
+
+        self.assertEqual(list(graph.neighbors(0)), [2, 4])
+        self.assertEqual(list(graph.neighbors(3)), [1])
+        self.assertEqual(graph.n_edges, 8)
+
+    def test_replay_matches_simulation(self):
+        persons = self._create_population(strength=2.0)
+        with ContactGraphWriter(self.path, len(persons)) as writer:
+            history = Simulation(persons, days=30, contact_graph=writer).run()
+
+        replayed = ReplaySimulation(self._create_population(strength=2.0), ContactGraphReader(self.path), days=30)
+        self.assertEqual(replayed.run(), history)
+
+    def test_replay_with_other_pathogen(self):
+        persons = self._create_population(strength=2.0)
+        with ContactGraphWriter(self.path, len(persons)) as writer:
+            Simulation(persons, days=30, early_stop=False, contact_graph=writer).run()
+
+        replayed = ReplaySimulation(self._create_population(strength=0.1), ContactGraphReader(self.path), days=30)
+        history = replayed.run()
+        self.assertEqual(len(history), 30)
+        self.assertEqual(history[-1]['Dead'], 0)
+
+
+#Event log and replay
+class TestEventLog(unittest.TestCase):
+
+    def setUp(self):
+        grid = set_grid(0, 5, 0, 5)
+        self.addCleanup(set_grid, *grid)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def _run_logged(self, name, closed_form=False):
+        random.seed(4)
+        persons = create_persons(0, 5, 0, 5, 80)
+        persons[0].get_infected(SARSCoV2(strength=3.0))
+        path = os.path.join(self.directory, name)
+        with EventLogWriter(path, len(persons), seed=5, batch_size=16) as log:
+            simulation = Simulation(persons, days=40, seed=5, observers=[log], closed_form=closed_form)
+            history = simulation.run()
+        return path, history
+
+    def test_state_at_matches_history(self):
+        for closed_form in (False, True):
+            path, history = self._run_logged('events.log', closed_form)
+            reader = EventLogReader(path)
+
+            self.assertEqual(reader.seed, 5)
+            for day in range(len(history)):
+                self.assertEqual(reader.state_at(day).counts(), history[day])
+
+    def test_same_seed_same_log(self):
+        first, _ = self._run_logged('first.log')
+        second, _ = self._run_logged('second.log')
+        with open(first, 'rb') as f, open(second, 'rb') as g:
+            self.assertEqual(f.read(), g.read())
+
+    def test_any_seed_reads_back(self):
+        path = os.path.join(self.directory, 'seeded.log')
+        for seed in (None, -1, 2 ** 64, 'run-a', b'run-b', 0.5):
+            with EventLogWriter(path, 3, seed=seed):
+                pass
+            self.assertEqual(EventLogReader(path).seed, seed)
+
+        os.remove(path)
+        with self.assertRaises(ValueError):
+            EventLogWriter(path, 3, seed=object())
+        self.assertFalse(os.path.exists(path))
+
+    def test_events_by_day(self):
+        path, _ = self._run_logged('events.log')
+        reader = EventLogReader(path)
+
+        events = reader.events(0)
+        self.assertEqual(events[0][1:3], (0, EventType.Infection))
+        for day in reader.days:
+            self.assertTrue(all(event[0] == day for event in reader.events(day)))
+        recoveries = [event for day in reader.days for event in reader.events(day)
+                      if event[2] == EventType.Recovery]
+        antibodies = reader.state_at(reader.days[-1]).antibodies
+        for _, agent, _, pathogen in recoveries:
+            self.assertTrue(antibodies[agent] & 1 << (pathogen - 1))
+
+
+#Tile decomposition
+class TestDistributed(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = (0, 9, 0, 9)
+
+    def test_tile_grid(self):
+        tiles = TileGrid(self.grid, (2, 3))
+
+        self.assertEqual(len(tiles), 6)
+        self.assertEqual(tiles.bounds(0), (0, 4, 0, 2))
+        self.assertEqual(tiles.tile_of((9, 9)), 5)
+        self.assertEqual(tiles.tile_of((4, 3)), 1)
+        self.assertEqual(sum(tiles.split_population(401)), 401)
+
+    def test_matches_single_process(self):
+        # a sparse grid where the outbreak is still growing at the end, compared as ensembles since
+        # the tiles draw from their own random streams
+        grid, n_persons, days, seeds = (0, 59, 0, 59), 900, 20, range(8)
+        infected = [(person_id, SARSCoV2(strength=1.0)) for person_id in range(0, n_persons, 45)]
+        previous = set_grid(*grid)
+        self.addCleanup(set_grid, *previous)
+        tiled, single = [], []
+        for seed in seeds:
+            history = TileCoordinator(n_persons, days=days, tiles=(2, 2), grid=grid, seed=seed,
+                                      infected=infected).run()
+            self.assertTrue(all(sum(counts.values()) == n_persons for counts in history))
+            tiled.append(history)
+            random.seed(seed)
+            persons = create_persons(*grid, n_persons)
+            for person_id, virus in infected:
+                persons[person_id].get_infected(virus)
+            single.append(Simulation(persons, days=days, early_stop=False).run())
+
+        self.assertGreater(tiled[0][-1]['Healthy'], n_persons // 4)
+        for day in range(days):
+            for name in STATE_NAMES:
+                a = [history[day][name] for history in tiled]
+                b = [history[day][name] for history in single]
+                error = sqrt((stdev(a) ** 2 + stdev(b) ** 2) / len(seeds))
+                self.assertLessEqual(abs(fmean(a) - fmean(b)), 4 * error + 1, (day, name))
+
+    def test_only_carriers_leave_a_worker(self):
+        previous = set_grid(*self.grid)
+        self.addCleanup(set_grid, *previous)
+        worker = TileWorker(None)
+        worker.setup({'tile': 0, 'grid': self.grid, 'tiles': (2, 2), 'seed': 1, 'n_persons': 500, 'id_offset': 0,
+                      'infected': [(3, virus_spec(SARSCoV2(strength=1.0)))]})
+        carriers = worker.day()
+
+        # one record for the single sick agent, none for the 499 others wherever they went
+        self.assertEqual(list(carriers.values()), [{InfectableType.SARSCoV2.value: (3, ANY)}])
+        # the agents of the worker in a cell with a carrier of another tile get infected locally
+        position = (9, 9)
+        present = [person for person in worker.persons if person.position == position and isinstance(person.state, Healthy)]
+        worker.night({position: [virus_spec(SARSCoV2(strength=1.0))]})
+        self.assertTrue(present)
+        self.assertTrue(all(isinstance(person.state, (AsymptomaticSick, SymptomaticSick)) for person in present))
+
+    def test_rejects_unauthenticated_connections(self):
+        unpickled = []
+
+        class Payload:
+            def __reduce__(self):
+                return unpickled.append, (True,)
+
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        coordinator = TileCoordinator(10, days=1, tiles=(1, 1), grid=self.grid, port=port, spawn_workers=False,
+                                      connect_timeout=1.0)
+        errors = []
+
+        def run():
+            try:
+                coordinator.run()
+            except RuntimeError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        for _ in range(100):
+            try:
+                intruder = socket.create_connection(('127.0.0.1', port))
+                break
+            except ConnectionRefusedError:
+                time.sleep(0.01)
+        with intruder:
+            try:
+                intruder.sendall(bytes(32))
+                send_message(intruder, Payload())
+            except OSError:
+                pass
+            thread.join()
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(unpickled, [])
+
+
+#Command line runner
+class TestScenarioCli(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.scenario = os.path.join(directory.name, 'scenario.json')
+        self.output = os.path.join(directory.name, 'results.json')
+        with open(self.scenario, 'w') as f:
+            json.dump({
+                'population': 50, 'grid': [0, 5, 0, 5], 'days': 20, 'seeds': [1, 2],
+                'pathogens': [{'type': 'SARSCoV2', 'infected': 2, 'strength': 1.0}],
+                'output': self.output,
+            }, f)
+
+    def test_run_scenario(self):
+        self.assertEqual(run_cli([self.scenario]), 0)
+        with open(self.output) as f:
+            results = json.load(f)
+
+        self.assertEqual([run['seed'] for run in results['runs']], [1, 2])
+        for run in results['runs']:
+            self.assertEqual(len(run['history']), 20)
+            self.assertEqual(sum(run['history'][0].values()), 50)
+
+    def test_same_seed_same_results(self):
+        run_cli([self.scenario])
+        with open(self.output) as f:
+            first = json.load(f)
+        run_cli([self.scenario])
+        with open(self.output) as f:
+            self.assertEqual(json.load(f), first)
+
+    def test_grid_is_restored(self):
+        grid = set_grid(0, 30, 0, 40)
+        self.addCleanup(set_grid, *grid)
+        run_cli([self.scenario])
+        self.assertEqual(set_grid(0, 30, 0, 40), (0, 30, 0, 40))
+
+    def test_plotting_is_not_imported(self):
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        code = 'import sys, epidemic.__main__; print("matplotlib" in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root)
+        self.assertEqual(output.strip(), b'False')
+
+
+#Metapopulation engine
+class TestMetapopulation(unittest.TestCase):
+
+    def setUp(self):
+        self.grid = (0, 19, 0, 19)
+        self.strengths = {InfectableType.SARSCoV2: 1.0}
+
+    def _run_metapopulation(self, agent_threshold):
+        random.seed(1)
+        metapopulation = Metapopulation(self.grid, agent_threshold=agent_threshold, strengths=self.strengths)
+        metapopulation.populate(2000)
+        for k in range(10):
+            metapopulation.infect((k, k), InfectableType.SARSCoV2, 1)
+        return metapopulation, metapopulation.run(30)
+
+    def test_binomial(self):
+        random.seed(0)
+        for n, p in ((20, 0.3), (10000, 0.001), (10000, 0.4), (50, 0.9)):
+            mean = sum(binomial(n, p) for _ in range(2000)) / 2000
+            self.assertAlmostEqual(mean, n * p, delta=0.05 * n * p + 0.5)
+
+    def test_hybrid_keeps_population(self):
+        metapopulation, history = self._run_metapopulation(agent_threshold=5)
+
+        self.assertTrue(metapopulation.agents)
+        self.assertTrue(metapopulation.cells)
+        for counts in history:
+            self.assertEqual(sum(counts.values()), 2000)
+
+    def test_consistent_with_agents(self):
+        grid = set_grid(*self.grid)
+        self.addCleanup(set_grid, *grid)
+        random.seed(1)
+        persons = create_persons(*self.grid, 2000)
+        for person in persons[:10]:
+            person.get_infected(SARSCoV2(strength=1.0))
+        expected = Simulation(persons, days=30, early_stop=False).run()
+
+        for agent_threshold in (0, 5):
+            _, history = self._run_metapopulation(agent_threshold)
+            for day in (10, 29):
+                for name in ('Healthy', 'Dead'):
+                    self.assertLess(abs(history[day][name] - expected[day][name]), 100)
+
+    def test_several_pathogens_never_overdraw_a_cell(self):
+        random.seed(2)
+        metapopulation = Metapopulation((0, 2, 0, 2))
+        metapopulation.populate(300)
+        for infectable_type in (InfectableType.SARSCoV2, InfectableType.Cholera, InfectableType.SeasonalFlu):
+            metapopulation.infect_random(infectable_type, 20)
+        for _ in range(30):
+            metapopulation.step()
+            for cell in metapopulation.cells.values():
+                compartments = list(cell.asymptomatic.values()) + list(cell.symptomatic.values())
+                self.assertTrue(all(count >= 0 for count in cell.healthy.values()))
+                self.assertTrue(all(count >= 0 for days in compartments for count in days))
+            self.assertEqual(sum(metapopulation.history[-1].values()), 300)
+
+    def test_immunity_accumulates(self):
+        random.seed(3)
+        metapopulation = Metapopulation((0, 0, 0, 0), strengths={InfectableType.Cholera: 1.0})
+        person = DefaultPerson(home_position=(0, 0))
+        person.antibody_types.add(InfectableType.SARSCoV2)
+        person.get_infected(Cholera(strength=1.0))
+        metapopulation.add_persons([person])
+        metapopulation.run(60)
+
+        cell = metapopulation.cells[0]
+        self.assertEqual(+cell.healthy, Counter({antibody_mask([InfectableType.SARSCoV2, InfectableType.Cholera]): 1}))
+        immune = metapopulation.counts_by_type()
+        self.assertEqual((immune[InfectableType.SARSCoV2]['Immune'], immune[InfectableType.Cholera]['Immune']), (1, 1))
+
+    def test_scenario_runs_the_engine(self):
+        config = {'population': 2000, 'grid': list(self.grid), 'days': 30, 'seed': 1, 'engine': 'metapopulation',
+                  'agent_threshold': 5, 'pathogens': [{'type': 'SARSCoV2', 'infected': 10, 'strength': 1.0}]}
+        history = Scenario.from_dict(config).run()['runs'][0]['history']
+        self.assertEqual(len(history), 30)
+        self.assertTrue(all(sum(counts.values()) == 2000 for counts in history))
+        self.assertGreater(max(counts['SymptomaticSick'] for counts in history), 0)
+
+        random.seed(1)
+        metapopulation = Metapopulation(self.grid, agent_threshold=5, strengths=self.strengths)
+        metapopulation.populate(2000)
+        self.assertEqual(metapopulation.infect_random(InfectableType.SARSCoV2, 10), 10)
+        self.assertEqual(metapopulation.run(30), history)
+
+        with self.assertRaises(ValueError):
+            Scenario.from_dict(dict(config, households=True))
+
+    def test_cli_imports_the_engine(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'scenario.json')
+        with open(path, 'w') as f:
+            json.dump({'population': 200, 'grid': [0, 9, 0, 9], 'days': 5, 'seed': 1, 'engine': 'metapopulation',
+                       'pathogens': [{'type': 'SARSCoV2', 'infected': 3}],
+                       'output': os.path.join(directory.name, 'results.json')}, f)
+        root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+        code = ('import sys, epidemic.__main__; epidemic.__main__.main([sys.argv[1]]); '
+                'print("epidemic.metapopulation" in sys.modules)')
+        output = subprocess.check_output([sys.executable, '-c', code, path], cwd=root)
+        self.assertEqual(output.strip(), b'True')
+
+
+#Household transmission
+class TestHouseholds(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(5)
+        self.persons = [DefaultPerson(home_position=(7, 7)) for _ in range(3)]
+        self.persons += [DefaultPerson(home_position=(1, 1)) for _ in range(2)]
+        self.persons[0].get_infected(SARSCoV2(strength=5.0))
+
+    def test_night_transmission(self):
+        simulation = Simulation(self.persons, days=1, early_stop=False, households=True)
+        # nobody meets during the day
+        simulation.contact_phase = lambda: []
+        simulation.run()
+
+        self.assertIsInstance(self.persons[1].state, AsymptomaticSick)
+        self.assertIsInstance(self.persons[2].state, AsymptomaticSick)
+        self.assertIsInstance(self.persons[3].state, Healthy)
+        self.assertEqual(dict(simulation.households.infectious), {(7, 7): 3})
+        # the index is kept by the simulation itself, not by scanning everyone for transitions
+        self.assertEqual(simulation.observers, [])
+
+    def test_no_night_transmission_by_default(self):
+        simulation = Simulation(self.persons, days=1, early_stop=False)
+        simulation.contact_phase = lambda: []
+        simulation.run()
+
+        self.assertIsInstance(self.persons[1].state, Healthy)
+
+    def test_dead_leave_household(self):
+        households = HouseholdIndex(self.persons)
+        self.assertEqual(households.sick, {0})
+        self.persons[0].state = Dead(self.persons[0])
+        households.update()
+
+        self.assertEqual(households.members[(7, 7)], [1, 2])
+        self.assertEqual(list(households.infected_households()), [])
+
+    def test_closed_form_matches_stepwise(self):
+        grid = set_grid(0, 9, 0, 9)
+        self.addCleanup(set_grid, *grid)
+        histories = []
+        for closed_form in (False, True):
+            random.seed(6)
+            persons = create_persons(0, 4, 0, 4, 100)
+            persons[0].get_infected(SARSCoV2(strength=2.0))
+            histories.append(Simulation(persons, days=40, households=True, closed_form=closed_form).run())
+
+        self.assertEqual(histories[0], histories[1])
+
+
+#Scenario forking
+class TestFork(unittest.TestCase):
+
+    def setUp(self):
+        grid = set_grid(0, 6, 0, 6)
+        self.addCleanup(set_grid, *grid)
+        self.addCleanup(DepartmentOfHealth().withdraw_policies)
+        random.seed(8)
+        self.persons = create_persons(0, 6, 0, 6, 150)
+        for person in self.persons[:3]:
+            person.get_infected(SARSCoV2(strength=3.0))
+
+    def test_noop_branch_continues_parent(self):
+        simulation = Simulation(self.persons, days=30, early_stop=False)
+        for _ in range(5):
+            simulation.step()
+        branches = simulation.fork({'baseline': lambda branch: None})
+        # the parent is untouched by its branches and carries on from the same state
+        self.assertEqual(simulation.day, 5)
+        history = simulation.run()
+
+        self.assertEqual(branches['baseline']['history'], history)
+        self.assertEqual(branches['baseline']['stop_reason'], StopReason.COMPLETED)
+
+    def test_lockdown_branch(self):
+        simulation = Simulation(self.persons, days=30, early_stop=False)
+        for _ in range(3):
+            simulation.step()
+        branches = simulation.fork({
+            'baseline': lambda branch: None,
+            'lockdown': lambda branch: DepartmentOfHealth().issue_policy(Lockdown(start_day=branch.day)),
+        })
+
+        healthy = {name: result['history'][-1]['Healthy'] for name, result in branches.items()}
+        self.assertGreater(healthy['lockdown'], healthy['baseline'])
+        self.assertEqual(DepartmentOfHealth().policies, [])
+
+    @staticmethod
+    def children():
+        # pids of the running and not yet reaped children of this process
+        pids = set()
+        for entry in os.listdir('/proc'):
+            try:
+                with open('/proc/{}/stat'.format(entry)) as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            if int(stat.rsplit(')', 1)[1].split()[1]) == os.getpid():
+                pids.add(int(entry))
+        return pids
+
+    def test_failed_branch(self):
+        simulation = Simulation(self.persons, days=10)
+        children = self.children()
+        descriptors = len(os.listdir('/proc/self/fd'))
+        with self.assertRaisesRegex(RuntimeError, 'Branch broken failed'):
+            simulation.fork({'broken': lambda branch: 1 / 0, 'a': lambda branch: None, 'b': lambda branch: None})
+        # the branches after the failed one are reaped and their pipes closed
+        self.assertEqual(self.children(), children)
+        self.assertEqual(len(os.listdir('/proc/self/fd')), descriptors)
+
+    def test_unpicklable_results(self):
+        simulation = Simulation(self.persons, days=3, early_stop=False)
+        with self.assertRaisesRegex(RuntimeError, 'Branch broken failed'):
+            simulation.fork({'broken': lambda branch: setattr(branch, 'results', lambda: {'history': lambda: None})})
+
+
+#Stratified subsampling
+class TestSampling(unittest.TestCase):
+
+    def setUp(self):
+        self.config = {
+            'population': 5000, 'grid': [0, 9, 0, 9], 'days': 30,
+            'pathogens': [{'type': 'SARSCoV2', 'infected': 10, 'strength': 1.0}],
+        }
+
+    def test_stratified_sample(self):
+        random.seed(9)
+        sample = StratifiedSample((0, 99, 0, 99), 10 ** 7, 0.001)
+        persons, weights = sample.draw()
+
+        self.assertEqual(len(persons), 10000)
+        self.assertAlmostEqual(sum(weights), 10 ** 7, delta=1)
+        # the sample keeps the people per cell of the full population
+        self.assertAlmostEqual(sample.density_ratio, 1.0, delta=0.05)
+        min_j, max_j, min_i, max_i = sample.contact_grid
+        for person in persons:
+            self.assertTrue(min_j <= person.home_position[0] <= max_j)
+            self.assertTrue(min_i <= person.home_position[1] <= max_i)
+        young = sum(weight for person, weight in zip(persons, weights) if person.age <= 45)
+        self.assertAlmostEqual(young / 10 ** 7, 0.5, delta=0.01)
+
+    def test_sampled_curves_match_full_population(self):
+        full = Scenario.from_dict(dict(self.config, seed=1)).run()['runs'][0]
+        sampled = Scenario.from_dict(dict(self.config, seed=2, sample={'fraction': 0.2, 'replicates': 4})).run()
+        sampled = sampled['runs'][0]
+
+        self.assertEqual(len(sampled['history']), 30)
+        self.assertEqual(len(sampled['replicates']), 4)
+        for counts, lower, upper in zip(sampled['history'], sampled['lower'], sampled['upper']):
+            self.assertAlmostEqual(sum(counts.values()), 5000)
+            for name in counts:
+                self.assertTrue(lower[name] <= counts[name] + 1e-6 <= upper[name] + 2e-6)
+        for name in ('Healthy', 'Dead'):
+            self.assertAlmostEqual(sampled['history'][-1][name], full['history'][-1][name], delta=250)
+
+    def test_sample_needs_agents_engine(self):
+        with self.assertRaises(ValueError):
+            Scenario.from_dict(dict(self.config, engine='metapopulation', sample={'fraction': 0.1}))
+        for key, value in (('event_log', 'run.evl'), ('contact_graph', 'graph.csv')):
+            with self.assertRaises(ValueError):
+                Scenario.from_dict(dict(self.config, sample={'fraction': 0.1}, **{key: value}))
+
+    def test_band_uses_student_t(self):
+        self.assertAlmostEqual(student_t_quantile(0.975, 4), 2.776, places=3)
+        self.assertAlmostEqual(student_t_quantile(0.995, 10), 3.169, places=3)
+        histories = [[dict.fromkeys(STATE_NAMES, 0.0, ) | {'Healthy': float(value)}] for value in range(5)]
+        mean, lower, upper = confidence_band(histories)
+        # mean 2, standard error sqrt(2.5 / 5), t with 4 degrees of freedom
+        self.assertAlmostEqual(mean[0]['Healthy'], 2.0)
+        self.assertAlmostEqual(upper[0]['Healthy'] - 2.0, 2.776 * sqrt(0.5), places=3)
+
+
+#Mobility schedules
+class TestMobility(unittest.TestCase):
+
+    def setUp(self):
+        grid = set_grid(0, 9, 0, 9)
+        self.addCleanup(set_grid, *grid)
+        random.seed(10)
+        self.persons = create_persons(0, 9, 0, 9, 500)
+        for person in self.persons[:3]:
+            person.get_infected(SARSCoV2(strength=1.0))
+
+    def test_groups_follow_plan(self):
+        schedule = MobilitySchedule.build((0, 9, 0, 9), 500, 2, seed=1, pattern=[0, 0, 1])
+        simulation = ScheduledSimulation(self.persons, schedule, days=12, early_stop=False)
+        rng_state = random.getstate()
+        for day in range(12):
+            simulation.day_phase()
+            self.assertEqual(sorted(simulation.colocated_groups()), sorted(Simulation.colocated_groups(simulation)))
+            healthy = [index for index, person in enumerate(self.persons) if isinstance(person.state, Healthy)]
+            positions = schedule.plans[[0, 0, 1][day % 3]].positions()
+            for index in healthy:
+                self.assertEqual(self.persons[index].position, positions[index])
+            simulation.contact_phase()
+            simulation.night_phase()
+            simulation.day += 1
+        # moving along the plans draws no random numbers
+        self.assertEqual(random.getstate(), rng_state)
+
+    def test_cached_schedule(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        built = MobilitySchedule.cached(directory.name, (0, 9, 0, 9), 500, 3, seed=2)
+        loaded = MobilitySchedule.cached(directory.name, (0, 9, 0, 9), 500, 3, seed=2)
+
+        self.assertEqual(len(os.listdir(directory.name)), 1)
+        for first, second in zip(built.plans, loaded.plans):
+            self.assertEqual(first.cells, second.cells)
+            self.assertEqual(first.groups(), second.groups())
+
+    def test_scenario_with_mobility(self):
+        config = {
+            'population': 300, 'grid': [0, 5, 0, 5], 'days': 10, 'seeds': [1, 2],
+            'pathogens': [{'type': 'SARSCoV2', 'infected': 2, 'strength': 1.0}],
+            'mobility': {'plans': 2, 'pattern': [0, 0, 0, 0, 0, 1, 1]},
+        }
+        scenario = Scenario.from_dict(config)
+        runs = scenario.run()['runs']
+
+        self.assertEqual(len(runs), 2)
+        self.assertEqual(sum(runs[0]['history'][-1].values()), 300)
+        self.assertEqual(scenario.mobility_schedule().pattern, [0, 0, 0, 0, 0, 1, 1])
+
+
+#Compact storage
+class TestCompact(unittest.TestCase):
+
+    def setUp(self):
+        grid = set_grid(0, 19, 0, 19)
+        self.addCleanup(set_grid, *grid)
+        random.seed(11)
+        self.persons = create_persons(0, 19, 0, 19, 2000)
+        for person in self.persons[:4]:
+            person.get_infected(SARSCoV2(strength=1.0))
+        for person in self.persons[4:8]:
+            person.get_infected(Cholera(strength=2.0))
+
+    def test_same_people_as_create_persons(self):
+        random.seed(12)
+        population = CompactPopulation.create(0, 19, 0, 19, 100)
+        random.seed(12)
+        for person, compact in zip(create_persons(0, 19, 0, 19, 100), population.to_persons()):
+            self.assertEqual((compact.age, compact.weight, compact.home_position),
+                             (person.age, person.weight, person.home_position))
+            self.assertAlmostEqual(compact.water, person.water, places=5)
+        self.assertLessEqual(population.nbytes / len(population), 40)
+
+    def test_round_trip(self):
+        self.persons[9].antibody_types.add(InfectableType.SeasonalFlu)
+        population = CompactPopulation.from_persons(self.persons)
+        for person, compact in zip(self.persons[:10], population.to_persons()):
+            self.assertIs(type(compact.state), type(person.state))
+            self.assertEqual(compact.antibody_types, person.antibody_types)
+            if person.virus is not None:
+                self.assertIs(compact.virus.get_type(), person.virus.get_type())
+                self.assertAlmostEqual(compact.virus.strength, person.virus.strength, places=5)
+
+    def test_within_tolerance_of_full_precision(self):
+        self.assertLessEqual(check_precision(self.persons, days=40, tolerance=0.05, seed=3), 0.05)
+
+    def test_scenario(self):
+        config = {
+            'population': 2000, 'grid': [0, 19, 0, 19], 'days': 40, 'seed': 4,
+            'pathogens': [{'type': 'SARSCoV2', 'infected': 5, 'strength': 1.0}],
+        }
+        full = Scenario.from_dict(config).run()['runs'][0]['history']
+        compact = Scenario.from_dict(dict(config, compact=True)).run()['runs'][0]['history']
+
+        self.assertEqual(full[0], compact[0])
+        for name in ('Healthy', 'Dead'):
+            self.assertAlmostEqual(full[-1][name], compact[-1][name], delta=100)
+        with self.assertRaises(ValueError):
+            Scenario.from_dict(dict(config, compact=True, households=True))
+
+
+#Population import
+class TestCensusImport(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def test_csv(self):
+        path = self.write('people.csv', 'id,age,weight,home_j,home_i,immune_SARSCoV2,immune_Cholera\n'
+                                        '1,30,70.5,3,4,1,0\n'
+                                        '2,80,60,0,9,no,yes\n'
+                                        '3,5,20,7,7,,\n')
+        population = read_csv(path, chunk_size=2)
+        persons = population.to_persons()
+
+        self.assertEqual(len(population), 3)
+        self.assertEqual([person.age for person in persons], [30, 80, 5])
+        self.assertEqual(persons[0].weight, 70.5)
+        self.assertEqual(persons[1].home_position, (0, 9))
+        self.assertEqual(persons[1].position, (0, 9))
+        self.assertAlmostEqual(persons[0].water, 0.6 * 70.5, places=4)
+        self.assertEqual(persons[0].antibody_types, {InfectableType.SARSCoV2})
+        self.assertEqual(persons[1].antibody_types, {InfectableType.Cholera})
+        self.assertEqual(persons[2].antibody_types, set())
+        self.assertTrue(all(isinstance(person.state, Healthy) for person in persons))
+
+    def test_fixed_width_with_mapped_columns(self):
+        path = self.write('people.txt', ' 25 80  10  20Y\n 61 55   0   1N\n')
+        fields = {'AGE': (0, 3), 'WT': (3, 6), 'Y': (6, 10), 'X': (10, 14), 'VACC': (14, 15)}
+        population = read_fixed_width(path, fields, columns={'age': 'AGE', 'weight': 'WT', 'home_j': 'Y', 'home_i': 'X'},
+                                      immunity={'SeasonalFlu': 'VACC'})
+        persons = population.to_persons()
+
+        self.assertEqual([(person.age, person.weight, person.home_position) for person in persons],
+                         [(25, 80, (10, 20)), (61, 55, (0, 1))])
+        self.assertEqual([person.antibody_types for person in persons], [{InfectableType.SeasonalFlu}, set()])
+
+    def test_validation(self):
+        header = 'age,weight,home_j,home_i\n'
+        for rows, message in (('30,70,1,1\n0,70,1,1\n', 'Row 2: age'),
+                              ('30,abc,1,1\n', 'Row 1: weight'),
+                              ('30,70,1,70000\n', 'Row 1: home_i'),
+                              ('30,70,1\n', 'Row 1: row'),
+                              ('30,70,1,1\n40,nan,1,1\n', 'Row 2: weight .* not finite'),
+                              ('30,70,1,1\n40,inf,1,1\n', 'Row 2: weight .* not finite'),
+                              ('30,-inf,1,1\n', 'Row 1: weight .* not finite'),
+                              ('30,70,1,1\n40,1e39,1,1\n', 'Row 2: weight .* out of')):
+            with self.assertRaisesRegex(ValueError, message):
+                read_csv(self.write('bad.csv', header + rows))
+        with self.assertRaisesRegex(ValueError, 'Missing columns: home_i'):
+            read_csv(self.write('bad.csv', 'age,weight,home_j\n'))
+
+        # fixed width errors name the line of the file, header and blank lines included
+        fields = {'age': (0, 3), 'weight': (3, 6), 'home_j': (6, 9), 'home_i': (9, 12)}
+        path = self.write('bad.txt', 'AGEWT Y  X  \n 30 70  1  1\n\n 40 70  1  1\n  0 70  1  1\n')
+        with self.assertRaisesRegex(ValueError, 'Line 5: age'):
+            read_fixed_width(path, fields, header=True, chunk_size=2)
+
+    def test_scenario_population_file(self):
+        rows = ''.join('{},70,{},{},{}\n'.format(20 + k % 50, k % 5, k // 5 % 5, int(k % 2 == 0)) for k in range(100))
+        path = self.write('people.csv', 'age,weight,home_j,home_i,immune_SARSCoV2\n' + rows)
+        config = {
+            'population_file': path, 'grid': [0, 4, 0, 4], 'days': 20, 'seed': 1,
+            'pathogens': [{'type': 'SARSCoV2', 'infected': 10, 'strength': 1.0}],
+        }
+        for compact in (False, True):
+            history = Scenario.from_dict(dict(config, compact=compact)).run()['runs'][0]['history']
+            self.assertEqual(sum(history[0].values()), 100)
+            # half of them are immune and cannot be infected
+            self.assertGreaterEqual(history[-1]['Healthy'], 45)
+
+
+#Contact radius
+class TestContactRadius(unittest.TestCase):
+
+    def setUp(self):
+        self.sick = DefaultPerson(home_position=(0, 0))
+        self.sick.get_infected(SARSCoV2(strength=2.0))
+        self.near = DefaultPerson(home_position=(0, 1))
+        self.far = DefaultPerson(home_position=(2, 0))
+        self.persons = [self.sick, self.near, self.far]
+
+    def test_cell_list_matches_brute_force(self):
+        random.seed(13)
+        positions = [(random.randint(0, 30), random.randint(0, 30)) for _ in range(300)]
+        cells = CellList(2.5)
+        for index, position in enumerate(positions):
+            cells.add(index, position)
+        for position in positions[:30]:
+            expected = sorted((index, distance(position, other)) for index, other in enumerate(positions)
+                              if distance(position, other) <= 2.5)
+            self.assertEqual(cells.near(position), expected)
+
+    def test_distance_decay(self):
+        simulation = Simulation(self.persons, contact_radius=1.5, contact_decay=1e-9)
+        self.assertEqual(simulation.contact_phase(), [])
+
+        simulation = Simulation(self.persons, contact_radius=1.5, contact_decay=1e9)
+        self.assertEqual(simulation.contact_phase(), [self.near])
+        self.assertIsInstance(self.far.state, Healthy)
+
+    def test_decay_must_be_positive(self):
+        for decay in (0, -1.0, float('nan')):
+            with self.assertRaises(ValueError):
+                Simulation(self.persons, contact_radius=1.5, contact_decay=decay)
+            with self.assertRaises(ValueError):
+                Scenario.from_dict({'population': 10, 'contact_radius': 1.5, 'contact_decay': decay})
+
+    def test_same_cell_always_transmits(self):
+        self.near.position = (0, 0)
+        simulation = Simulation(self.persons, contact_radius=3, contact_decay=1e-9)
+        self.assertEqual(simulation.contact_phase(), [self.near])
+
+    def test_radius_zero_is_exact_cell(self):
+        grid = set_grid(0, 5, 0, 5)
+        self.addCleanup(set_grid, *grid)
+        histories = []
+        for kwargs in ({}, {'contact_radius': 0}):
+            random.seed(14)
+            persons = create_persons(0, 5, 0, 5, 100)
+            persons[0].get_infected(SARSCoV2(strength=1.0))
+            histories.append(Simulation(persons, days=20, **kwargs).run())
+        self.assertEqual(histories[0], histories[1])
+        self.assertTrue(self.sick.is_contacting(self.near, radius=1))
+        self.assertFalse(self.sick.is_contacting(self.near))
+
+
+#Co-infection
+class TestCoinfection(unittest.TestCase):
+
+    def setUp(self):
+        grid = set_grid(0, 9, 0, 9)
+        self.addCleanup(set_grid, *grid)
+
+    def test_single_pathogen_matches_compact(self):
+        random.seed(15)
+        population = CompactPopulation.create(0, 9, 0, 9, 1000)
+        for index in range(3):
+            population.get_infected(index, SARSCoV2(strength=1.0))
+        compact = CompactSimulation(population.copy(), days=40, seed=1).run()
+        coinfection = CoinfectionSimulation(population.copy(), [InfectableType.SARSCoV2], days=40, seed=1).run()
+
+        self.assertEqual(coinfection, compact)
+
+    def test_carriers_pass_on_both_pathogens(self):
+        population = CompactPopulation.from_persons([DefaultPerson(home_position=(1, 1)) for _ in range(3)])
+        simulation = CoinfectionSimulation(population, [InfectableType.SARSCoV2, InfectableType.Cholera])
+        simulation.get_infected(0, SARSCoV2(strength=1.0))
+        simulation.get_infected(1, Cholera(strength=1.0))
+        simulation.contact_phase()
+
+        for infectable_type in (InfectableType.SARSCoV2, InfectableType.Cholera):
+            columns = simulation.columns(infectable_type)
+            self.assertEqual(columns.infected, {0, 1, 2})
+        self.assertEqual(simulation.counts()['AsymptomaticSick'], 3)
+
+    def test_symptoms_add_up(self):
+        population = CompactPopulation.from_persons([DefaultPerson(age=50, weight=100)])
+        simulation = CoinfectionSimulation(population, [InfectableType.SARSCoV2, InfectableType.Cholera], days=20)
+        simulation.get_infected(0, SARSCoV2(strength=5.0))
+        simulation.get_infected(0, Cholera(strength=5.0))
+        for _ in range(4):
+            simulation.step()
+
+        # three nights to fall ill, then one day of both symptoms
+        self.assertAlmostEqual(population.temperature[0], 36.6 + SARSCoV2.TEMPERATURE_PER_DAY, places=4)
+        self.assertAlmostEqual(population.water[0], 60.0 - Cholera.WATER_PER_DAY, places=4)
+        self.assertEqual(simulation.counts_by_type()['Cholera']['SymptomaticSick'], 1)
+
+    def test_scenario(self):
+        config = {
+            'population': 500, 'grid': [0, 9, 0, 9], 'days': 30, 'seed': 3, 'compact': True, 'coinfection': True,
+            'pathogens': [{'type': 'SARSCoV2', 'infected': 3, 'strength': 1.0},
+                          {'type': 'Cholera', 'infected': 3, 'strength': 1.0}],
+        }
+        run = Scenario.from_dict(config).run()['runs'][0]
+
+        self.assertEqual(len(run['pathogens']), len(run['history']))
+        self.assertEqual(set(run['pathogens'][0]), {'SARSCoV2', 'Cholera'})
+        with self.assertRaises(ValueError):
+            Scenario.from_dict(dict(config, compact=False))
+
+    def test_asymptomatic_sick_ignores_second_exposure(self):
+        person = DefaultPerson()
+        person.get_infected(SARSCoV2())
+        person.get_infected(Cholera())
+
+        self.assertIs(person.virus.get_type(), InfectableType.SARSCoV2)
+
+
+#Job service
+class TestJobService(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = directory.name
+        self.config = {
+            'population': 50, 'grid': [0, 5, 0, 5], 'days': 10, 'seed': 1,
+            'pathogens': [{'type': 'SARSCoV2', 'infected': 2, 'strength': 1.0}],
+        }
+
+    def serve(self, test, workers=2):
+        async def run():
+            service = JobService(workers, ResultStore(self.store))
+            port = await service.start()
+            try:
+                return await test(service, port)
+            finally:
+                await service.close()
+        return asyncio.run(run())
+
+    def test_submit_and_fetch(self):
+        async def test(service, port):
+            first = await request('127.0.0.1', port, 'POST', '/jobs', {'scenario': self.config})
+            # the same config in another key order is the same job
+            again = await request('127.0.0.1', port, 'POST', '/jobs', {'scenario': dict(reversed(self.config.items()))})
+            await service.wait(first[1]['id'])
+            status = await request('127.0.0.1', port, 'GET', '/jobs/' + first[1]['id'])
+            result = await request('127.0.0.1', port, 'GET', '/jobs/' + first[1]['id'] + '/result')
+            return first, again, status, result
+
+        first, again, status, result = self.serve(test)
+        self.assertEqual(first[0], 202)
+        self.assertEqual((again[0], again[1]['id']), (200, first[1]['id']))
+        self.assertEqual(status[1]['status'], 'done')
+        self.assertEqual(result, (200, json.loads(json.dumps(Scenario.from_dict(self.config).run()))))
+
+    def test_priorities(self):
+        async def test(service, port):
+            jobs = [service.submit(dict(self.config, seed=seed), priority)[0].id
+                    for seed, priority in ((1, 0), (2, 5), (3, 1))]
+            for job in jobs:
+                await service.wait(job)
+            return jobs, service.started
+
+        # the jobs are queued before the single worker picks the first one up
+        jobs, started = self.serve(test, workers=1)
+        self.assertEqual(started, [jobs[1], jobs[2], jobs[0]])
+
+    def test_errors(self):
+        async def test(service, port):
+            return [
+                await request('127.0.0.1', port, 'POST', '/jobs', {'scenario': dict(self.config, engine='quantum')}),
+                await request('127.0.0.1', port, 'POST', '/jobs', {'scenario': self.config, 'priority': float('inf')}),
+                await request('127.0.0.1', port, 'GET', '/jobs/unknown'),
+                await request('127.0.0.1', port, 'DELETE', '/jobs'),
+            ]
+
+        statuses = [status for status, _ in self.serve(test)]
+        self.assertEqual(statuses, [400, 400, 404, 405])
+
+    def test_results_survive_restarts(self):
+        async def submit(service, port):
+            job, _ = service.submit(self.config)
+            await service.wait(job.id)
+            return job.id
+
+        async def resubmit(service, port):
+            return await request('127.0.0.1', port, 'POST', '/jobs', {'scenario': self.config})
+
+        job = self.serve(submit)
+        status, description = self.serve(resubmit)
+        self.assertEqual((status, description['id'], description['status']), (200, job, 'done'))
+
+    def test_server_paths(self):
+        async def test(service, port):
+            rejected = [await request('127.0.0.1', port, 'POST', '/jobs', {'scenario': dict(self.config, **{key: value})})
+                        for key, value in (('event_log', '/tmp/run.evl'), ('contact_graph', '/tmp/graph.csv'),
+                                           ('population_file', '/etc/passwd'))]
+            job, _ = service.submit(dict(self.config, output='/tmp/out.json',
+                                         mobility={'plans': 2, 'cache': '/tmp/schedules'}))
+            return rejected, job.config
+
+        rejected, config = self.serve(test)
+        self.assertEqual([status for status, _ in rejected], [400, 400, 400])
+        self.assertNotIn('output', config)
+        self.assertEqual(config['mobility'], {'plans': 2})
+
+    def test_failed_job_runs_again_on_a_new_pool(self):
+        async def test(service, port):
+            # a pool whose process died, as after a crash or the OOM killer
+            broken = ProcessPoolExecutor(1)
+            with self.assertRaises(BrokenProcessPool):
+                broken.submit(os._exit, 1).result()
+            service.executor.shutdown()
+            service.executor = broken
+            job, _ = service.submit(self.config)
+            failed = await service.wait(job.id)
+            again = await request('127.0.0.1', port, 'POST', '/jobs', {'scenario': self.config})
+            await service.wait(job.id)
+            return failed, again, service.status(job.id)
+
+        failed, again, status = self.serve(test, workers=1)
+        self.assertEqual(failed['status'], 'failed')
+        self.assertIn('BrokenProcessPool', failed['error'])
+        self.assertEqual((again[0], again[1]['status']), (202, 'queued'))
+        self.assertEqual(status['status'], 'done')
+
+
+
+#Performance regressions
+class TestPerformance(unittest.TestCase):
+    BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'performance_baselines.json')
+
+    @classmethod
+    def setUpClass(cls):
+        cls.baselines = benchmark.load_baselines(cls.BASELINES)
+
+    def test_reference_scenarios_meet_baselines(self):
+        measured = benchmark.measure_all()
+        self.assertEqual(set(measured['scenarios']), set(self.baselines['scenarios']))
+        regressions = benchmark.compare(measured, self.baselines)
+        self.assertEqual(regressions, [], '\n'.join(regressions))
+
+    def test_allocations_are_reproducible(self):
+        config = benchmark.REFERENCE_SCENARIOS['outbreak']
+        self.assertEqual(benchmark.trace_run(config), benchmark.trace_run(config))
+
+    def test_slower_symptomatic_day_is_caught(self):
+        check_condition = SymptomaticSick.check_condition
+
+        def slow_check_condition(state):
+            # a list kept by everyone ill and some busy work
+            state.person.notes = [state.person.temperature] * 200
+            sum(range(2000))
+            check_condition(state)
+
+        SymptomaticSick.check_condition = slow_check_condition
+        self.addCleanup(setattr, SymptomaticSick, 'check_condition', check_condition)
+        measured = {'scenarios': {'symptomatic': benchmark.measure(benchmark.REFERENCE_SCENARIOS['symptomatic'], 1)}}
+        baselines = {'scenarios': {'symptomatic': self.baselines['scenarios']['symptomatic']}}
+        regressions = benchmark.compare(measured, baselines)
+        self.assertTrue(any('agent-days/s' in regression for regression in regressions))
+        self.assertTrue(any('bytes_per_day' in regression for regression in regressions))
+
+
+#Pathogen registry
+class TestPathogenRegistry(unittest.TestCase):
+
+    def test_get_infectable_draws_as_before(self):
+        rates = {InfectableType.SeasonalFlu: 10.0, InfectableType.SARSCoV2: 2.0, InfectableType.Cholera: 2.0}
+        for infectable_type, rate in rates.items():
+            random.seed(5)
+            virus = get_infectable(infectable_type)
+            random.seed(5)
+            expected = (random.expovariate(rate), random.expovariate(rate))
+            self.assertEqual(virus.get_type(), infectable_type)
+            self.assertEqual((virus.strength, virus.contag), expected)
+
+    def test_unknown_and_duplicate_types(self):
+        with self.assertRaises(ValueError):
+            get_infectable('Measles')
+        with self.assertRaises(ValueError):
+            register_pathogen(InfectableType.Cholera, Cholera)
+
+    def test_kernels_run_once_per_pathogen_per_day(self):
+        calls = []
+
+        class CountedFlu(SeasonalFluVirus):
+            @classmethod
+            def cause_symptoms_columns(cls, temperature, water, indices):
+                calls.append(('symptoms', len(indices)))
+                super().cause_symptoms_columns(temperature, water, indices)
+
+            @classmethod
+            def fight_virus_columns(cls, strength, age, indices):
+                calls.append(('recovery', len(indices)))
+                return super().fight_virus_columns(strength, age, indices)
+
+        grid = set_grid(0, 5, 0, 5)
+        self.addCleanup(set_grid, *grid)
+
+        def run():
+            random.seed(11)
+            population = CompactPopulation.create(0, 5, 0, 5, 200)
+            for index in range(0, 200, 10):
+                population.get_infected(index, get_infectable(InfectableType.SeasonalFlu))
+            return CompactSimulation(population, days=15, early_stop=False).run()
+
+        expected = run()
+        PATHOGENS[InfectableType.SeasonalFlu] = CountedFlu
+        self.addCleanup(PATHOGENS.__setitem__, InfectableType.SeasonalFlu, SeasonalFluVirus)
+        self.assertEqual(run(), expected)
+        self.assertGreater(len(calls), 0)
+        self.assertLessEqual(len(calls), 2 * 15)
+        self.assertTrue(all(size > 0 for _, size in calls))
+
+        # the object engine runs the same kernel, once per pathogen per day as well
+        del calls[:]
+        random.seed(11)
+        persons = create_persons(0, 5, 0, 5, 200)
+        for person in persons[::10]:
+            person.get_infected(get_infectable(InfectableType.SeasonalFlu))
+        Simulation(persons, days=15, early_stop=False).run()
+        symptoms = [size for name, size in calls if name == 'symptoms']
+        self.assertGreater(len(symptoms), 0)
+        self.assertLessEqual(len(symptoms), 15)
+        self.assertGreater(max(symptoms), 1)
+
+    def test_symptoms_are_declared_once(self):
+        class Fever(SeasonalFluVirus):
+            @classmethod
+            def cause_symptoms_columns(cls, temperature, water, indices):
+                for index in indices:
+                    temperature[index] += 1.5
+                    water[index] -= 0.5
+
+        person = DefaultPerson()
+        temperature, water = person.temperature, person.water
+        Fever().cause_symptoms(person)
+        self.assertEqual((person.temperature, person.water), (temperature + 1.5, water - 0.5))
+        self.assertEqual(Fever.symptoms_per_day(), (1.5, 0.5))
+        self.assertEqual(Cholera.symptoms_per_day(), (0.0, Cholera.WATER_PER_DAY))
+
+        class PerPersonFever(SeasonalFluVirus):
+            def cause_symptoms(self, person):
+                person.temperature += 1.5
+
+        # the column engines and the closed form would never see these symptoms
+        with self.assertRaisesRegex(ValueError, 'cause_symptoms_columns'):
+            register_pathogen(InfectableType.SeasonalFlu, PerPersonFever)
+
+
+#Incidence maps
+class TestIncidence(unittest.TestCase):
+
+    def test_views_and_pyramid(self):
+        incidence = IncidenceMap((10, 14, 20, 22), window=2, levels=3)
+        self.assertEqual([incidence.shape(level) for level in range(3)], [(5, 3), (3, 2), (2, 1)])
+        incidence.record([(10, 20), (10, 20), (14, 22)])
+        incidence.end_day()
+        incidence.record([(11, 21), (9, 20)])
+        incidence.end_day()
+        self.assertEqual(incidence.to_rows('rolling', 1), [[3, 0], [0, 0], [0, 1]])
+        incidence.end_day()
+        self.assertEqual(incidence.to_rows('rolling'), [[0, 0, 0], [0, 1, 0], [0, 0, 0], [0, 0, 0], [0, 0, 0]])
+        self.assertEqual(incidence.to_rows('cumulative', 2), [[3], [1]])
+        self.assertEqual(incidence.outside, 1)
+        exported = incidence.export()
+        self.assertEqual((exported['grid'], exported['day']), ([10, 14, 20, 22], 3))
+        self.assertEqual(exported['cumulative'][0][0], [2, 0, 0])
+
+    def test_counts_every_transmission(self):
+        grid = set_grid(0, 9, 0, 9)
+        self.addCleanup(set_grid, *grid)
+        random.seed(4)
+        persons = create_persons(0, 9, 0, 9, 300)
+        for person in persons[:5]:
+            person.get_infected(SARSCoV2(strength=2.0, contag=1.0))
+        incidence = IncidenceMap((0, 9, 0, 9), window=3, levels=4)
+        Simulation(persons, days=20, incidence=incidence).run()
+
+        infected = sum(1 for person in persons if not isinstance(person.state, Healthy) or person.antibody_types)
+        self.assertGreater(infected, 5)
+        for level in range(4):
+            self.assertEqual(sum(incidence.view('cumulative', level)), infected - 5)
+        self.assertLessEqual(sum(incidence.view('rolling')), infected - 5)
+
+    def test_scenario_export(self):
+        config = {'population': 400, 'grid': [0, 7, 0, 7], 'days': 15, 'seed': 2, 'compact': True,
+                  'pathogens': [{'type': 'Cholera', 'infected': 4}], 'incidence': {'window': 5, 'levels': 2}}
+        run = Scenario.from_dict(config).run()['runs'][0]
+        cumulative = run['incidence']['cumulative']
+        self.assertEqual(len(cumulative), 2)
+        self.assertEqual(sum(map(sum, cumulative[0])), sum(map(sum, cumulative[1])))
+        self.assertGreater(sum(map(sum, cumulative[0])), 0)
+        with self.assertRaises(ValueError):
+            Scenario.from_dict(dict(config, incidence={'bins': 3}))
         
 if __name__ == "__main__":
 	unittest.main()